@@ -81,6 +81,7 @@ import machine
 import struct
 import uctypes
 from micropython import const
+import perf
 
 ILI9341_SLPOUT = const(0x11)
 ILI9341_GAMMASET = const(0x26)
@@ -107,19 +108,25 @@ MADCTL_ML = const(0x10)
 MADCTL_BGR = const(0x08)
 MADCTL_MH = const(0x04)
 
+SSPSR_BSY = const(0x10)
+
+PERF_FLUSH = perf.hist('flush')             # start of a transfer to flush_ready
+PERF_FLUSH_BYTES = perf.hist('flush.B', 'B')
+
 PORTRAIT = const(0)
 LANDSCAPE = const(1)
 INV_PORTRAIT = const(2)
 INV_LANDSCAPE = const(3)
 
 class ILIxxxx_hw(object):
-    def __init__(self, *, cs = 9, dc = 8, spi, res=(240,320), bl = 13, rst = 15, rot = PORTRAIT, bgr = False, rp2_dma = None):
+    def __init__(self, *, cs = 9, dc = 8, spi, spi_id = 1, res=(240,320), bl = 13, rst = 15, rot = PORTRAIT, bgr = False, rp2_dma = None):
         '''
         This is an abstract low-level driver the ST77xx controllers, not to be instantiated directly.
         Derived classes implement chip-specific bits. THe following parameters are recognized:
 
         * *cs*: chip select pin (= slave select, SS)
         * *dc*: data/command pin
+        * *spi_id*: hardware SPI bus of *spi*, for the DMA
         * *bl*: backlight PWM pin (optional)
         * *model*: display model, to account for variations in products
         * *rst*: optional reset pin
@@ -135,6 +142,7 @@ class ILIxxxx_hw(object):
         self.buf1 = bytearray(1)
         self.buf2 = bytearray(2)
         self.buf4 = bytearray(4)
+        self.fill_word = bytearray(2)   # separate heap block, so aligned for the 2 byte DMA ring
 
         self.cs = machine.Pin(cs, machine.Pin.OUT)
         self.dc = machine.Pin(dc, machine.Pin.OUT)
@@ -153,6 +161,13 @@ class ILIxxxx_hw(object):
         self.bgr = bgr
         self.spi = spi
         self.rp2_dma = rp2_dma
+        self.dma_active = False     # a DMA transfer holds CS low
+        self.dma_irq = False        # its end is signalled by the DMA IRQ (see ILIxxxx_lvgl)
+        self.dma_flush = False      # the transfer is an LVGL flush, to be acknowledged
+        if rp2_dma:
+            from rp2_dma import spiTx, spiStatus
+            self.spi_dr, self.spi_dreq = spiTx(spi_id)
+            self.spi_sr = spiStatus(spi_id)
         self.hard_reset()
 
     def off(self):
@@ -209,25 +224,47 @@ class ILIxxxx_hw(object):
     def blit(self, x, y, w, h, buf, is_blocking=True):
         self.set_window(x, y, w, h)
         if self.rp2_dma:
-            self._rp2_write_register_dma(ILI9341_RAMWR, buf, is_blocking=True)
+            self._rp2_write_register_dma(ILI9341_RAMWR, buf, is_blocking)
         else:
             self.write_register(ILI9341_RAMWR, buf)
 
-    def clear(self, color):
+    def fill_rect(self, x, y, w, h, color, is_blocking=True):
+        '''
+        Fill a rectangle with the RGB565 *color*. With DMA this is one transfer that reads the
+        two colour bytes over and over (read ring of 2 bytes), so no Python loop runs.
+        '''
+        if w <= 0 or h <= 0:
+            return
+        self.rp2_wait_dma()
+        self.set_window(x, y, w, h)
+        struct.pack_into('>H', self.fill_word, 0, color)
+        if self.rp2_dma:
+            self.rp2_dma.config(
+                src_addr  = uctypes.addressof(self.fill_word),
+                dst_addr  = self.spi_dr,
+                count     = 2 * w * h,
+                src_inc   = True,
+                dst_inc   = False,
+                trig_dreq = self.spi_dreq,
+                ring_bits = 1
+            )
+            self._rp2_start_dma(ILI9341_RAMWR, is_blocking)
+            return
         bs = 128 # write pixels in chunks; makes the fill much faster
-        struct.pack_into('>h', self.buf2, 0, color)
-        buf = bs * bytes(self.buf2)
-        npx = self.width * self.height
-        self.set_window(0, 0, self.width, self.height)
+        buf = bs * bytes(self.fill_word)
+        npx = w * h
         self.write_register(ILI9341_RAMWR, None)
         self.cs.value(0)
         self.dc.value(1)
         for _ in range(npx // bs):
             self.spi.write(buf)
         for _ in range(npx % bs):
-            self.spi.write(self.buf2)
+            self.spi.write(self.fill_word)
         self.cs.value(1)
 
+    def clear(self, color):
+        self.fill_rect(0, 0, self.width, self.height, color)
+
     def write_register(self, reg, buf = None):
         struct.pack_into('B', self.buf1, 0, reg)
         self.cs.value(0)
@@ -240,21 +277,24 @@ class ILIxxxx_hw(object):
 
     def _rp2_write_register_dma(self, reg, buf, is_blocking=True):
         'If *is_blocking* is False, used should call wait_dma explicitly.'
-        SPI1_BASE = 0x40040000 # FIXME: will be different for another SPI bus?
-        SSPDR     = 0x008
         self.rp2_dma.config(
             src_addr  = uctypes.addressof(buf),
-            dst_addr  = SPI1_BASE + SSPDR,
+            dst_addr  = self.spi_dr,
             count     = len(buf),
             src_inc   = True,
             dst_inc   = False,
-            trig_dreq = self.rp2_dma.DREQ_SPI1_TX
+            trig_dreq = self.spi_dreq
         )
+        self._rp2_start_dma(reg, is_blocking)
+
+    def _rp2_start_dma(self, reg, is_blocking):
+        'Send command *reg*, then start the configured DMA channel on its data.'
         struct.pack_into('B', self.buf1, 0, reg)
         self.cs.value(0)
         self.dc.value(0)
         self.spi.write(self.buf1)
         self.dc.value(1)
+        self.dma_active = True
         self.rp2_dma.enable()
 
         if is_blocking:
@@ -264,13 +304,22 @@ class ILIxxxx_hw(object):
         '''
         Wait for rp2-port DMA transfer to finish; no-op unless self.rp2_dma is defined.
         Can be used as callback before accessing shared SPI bus e.g. with the xpt2046 driver.
+        With the DMA IRQ in use the interrupt handler ends the transfer, otherwise it is done here.
         '''
-        if self.rp2_dma is None: return
+        if self.rp2_dma is None or not self.dma_active: return
+        if self.dma_irq:
+            while self.dma_active: pass
+            return
         while self.rp2_dma.is_busy(): pass
+        self.rp2_end_dma()
+
+    def rp2_end_dma(self):
+        'Release the bus after a DMA transfer; allocation free, also called from the DMA IRQ.'
         self.rp2_dma.disable()
-        # wait to send last byte. It should take < 1uS @ 10MHz
-        time.sleep_us(10)
+        # the DMA is done once the last bytes are in the SPI FIFO; wait until they are sent
+        while machine.mem32[self.spi_sr] & SSPSR_BSY: pass
         self.cs.value(1)
+        self.dma_active = False
 
     def _run_seq(self,seq):
         '''
@@ -332,16 +381,46 @@ class ILIxxxx_lvgl(object):
 
     '''
     def disp_drv_flush_cb(self, disp_drv, area, color):
-#        self.rp2_wait_dma() # wait if not yet done and DMA is being used
+        '''
+        Start the DMA transfer of *area* and return. With the DMA IRQ the handler calls
+        flush_ready once the area is sent; without it (firmware before MicroPython 1.21) a
+        double buffered display is released at once, as LVGL renders the next area into the
+        other buffer and the next flush waits for this transfer.
+        '''
+        t0 = time.ticks_us()
         self.rp2_wait_dma()
-        self.blit(area.x1,
-                  area.y1,
-                  w := (area.x2 - area.x1 + 1),
-                  h := (area.y2 - area.y1 + 1),
-                  color.__dereference__(2 * w * h),
-                  is_blocking=False
-                  )
-        self.disp_drv.flush_ready()
+        t1 = time.ticks_us()
+        self.flush_wait_us += time.ticks_diff(t1, t0)
+        self.flush_start = t1
+        self.dma_flush = self.dma_irq
+        w = area.x2 - area.x1 + 1
+        h = area.y2 - area.y1 + 1
+        PERF_FLUSH_BYTES.add(2 * w * h)
+        self.blit(area.x1, area.y1, w, h, color.__dereference__(2 * w * h),
+                  is_blocking=not (self.dma_irq or self.doublebuffer))
+        if not self.dma_irq:
+            self.flush_done()
+            self.disp_drv.flush_ready()
+
+    def dma_irq_cb(self, dma):
+        self.rp2_end_dma()
+        if self.dma_flush:
+            self.dma_flush = False
+            self.flush_done()
+            self.flush_ready()
+
+    def flush_done(self):
+        '''
+        Flush statistics: *flush_count* areas; *flush_us* average and *flush_max_us* longest
+        time from the start of a transfer to flush_ready; *flush_wait_us* total time a flush
+        waited for the previous transfer. No allocation, it runs in the DMA IRQ.
+        '''
+        dt = time.ticks_diff(time.ticks_us(), self.flush_start)
+        self.flush_count += 1
+        self.flush_us += (dt - self.flush_us) >> 3
+        if dt > self.flush_max_us:
+            self.flush_max_us = dt
+        PERF_FLUSH.add(dt)
 
     def __init__(self, doublebuffer = True, factor = 4):
         import lvgl as lv
@@ -363,6 +442,16 @@ class ILIxxxx_lvgl(object):
         self.disp_drv.set_draw_buffers(bytearray(bufSize), bytearray(bufSize) if doublebuffer else None, bufSize, lv.DISP_RENDER_MODE.PARTIAL)
         self.disp_drv.set_color_format(lv.COLOR_FORMAT.NATIVE if self.bgr else lv.COLOR_FORMAT.NATIVE_REVERSED)
 
+        self.doublebuffer = doublebuffer
+        self.flush_count = 0
+        self.flush_us = 0
+        self.flush_max_us = 0
+        self.flush_wait_us = 0
+        self.flush_start = 0
+        self.flush_ready = self.disp_drv.flush_ready     # bound once: the IRQ must not allocate
+        if self.rp2_dma:
+            self.dma_irq = self.rp2_dma.irq(self.dma_irq_cb)
+
 
 class ILI9341(ILI9341_hw, ILIxxxx_lvgl):
     def __init__(self, res, doublebuffer = True, factor = 4, **kw):
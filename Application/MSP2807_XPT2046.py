@@ -30,13 +30,58 @@ SOFTWARE.
 '''
 
 import machine
+import micropython
+import time
+import perf
 import struct
+import array
 
 PORTRAIT = const(0)
 LANDSCAPE = const(1)
 INV_PORTRAIT = const(2)
 INV_LANDSCAPE = const(3)
 
+Z_MIN = const(80)           # Z1 (12 bit) above this: the pen is down
+SPREAD = const(24)          # three samples within this many raw units have settled
+SAMPLES_MAX = const(16)
+
+PERF_TOUCH = perf.hist('touch')             # pos() in the LVGL read callback
+CAL_SHIFT = const(16)       # calibration coefficients are fixed point with 16 fraction bits
+
+def affine(screen, raw):
+    '''
+    Calibration coefficients (a, b, c, d, e, f) mapping raw (rx, ry) to pixels x = a*rx + b*ry + c,
+    y = d*rx + e*ry + f, from three *screen* points (in the rotated coordinates LVGL uses) and the
+    *raw* readings taken there; None if the points are on a line.
+    '''
+    (x0, y0), (x1, y1), (x2, y2) = screen
+    (r0, s0), (r1, s1), (r2, s2) = raw
+    det = r0 * (s1 - s2) - s0 * (r1 - r2) + (r1 * s2 - r2 * s1)
+    if det == 0:
+        return None
+    cal = []
+    for v0, v1, v2 in ((x0, x1, x2), (y0, y1, y2)):
+        a = v0 * (s1 - s2) - s0 * (v1 - v2) + (v1 * s2 - v2 * s1)
+        b = r0 * (v1 - v2) - v0 * (r1 - r2) + (r1 * v2 - r2 * v1)
+        c = r0 * (s1 * v2 - s2 * v1) - s0 * (r1 * v2 - r2 * v1) + v0 * (r1 * s2 - r2 * s1)
+        cal += [round((a << CAL_SHIFT) / det), round((b << CAL_SHIFT) / det), round((c << CAL_SHIFT) / det)]
+    return tuple(cal)
+
+@micropython.viper
+def _affine(cal: ptr32, rx: int, ry: int) -> int:
+    'x << 16 | y of the pixel at raw (rx, ry), clamped to what fits.'
+    x = (cal[0] * rx + cal[1] * ry + cal[2]) >> CAL_SHIFT
+    y = (cal[3] * rx + cal[4] * ry + cal[5]) >> CAL_SHIFT
+    if x < 0:
+        x = 0
+    elif x > 0x7FFF:
+        x = 0x7FFF
+    if y < 0:
+        y = 0
+    elif y > 0xFFFF:
+        y = 0xFFFF
+    return (x << 16) | y
+
 class Xpt2046_hw(object):
     CHAN_X  = const(0b0101_0000)
     CHAN_Y  = const(0b0001_0000)
@@ -63,7 +108,7 @@ class Xpt2046_hw(object):
         return ret
 
     def __init__(self,*,
-        spi: machine.SPI, cs = 16, bits = 12, ranges=((100,1900),(200,1950)), width = 240, height = 320, rot = PORTRAIT):
+        spi: machine.SPI, cs = 16, bits = 12, ranges=((100,1900),(200,1950)), width = 240, height = 320, rot = PORTRAIT, cal = None):
         '''
         Construct the Xpt2046 touchscreen controller.
         *spi*: spi bus instance; its baud rate must *not* exceed 2_000_000 (2MHz) for correct functionality
@@ -73,8 +118,11 @@ class Xpt2046_hw(object):
         *width*: width of the underyling screen in pixels, in natural (rot=0) orientation (0..*width* is the range for reported horizontal coordinate)
         *height*: height of the underyling screen in pixels
         *rot*: screen rotation (0: portrait, 1: landscape, 2: inverted portrait, 3: inverted landscape); the constants XPT2046_PORTRAIT, XPT2046_LANDSCAPE, XPT2046_INV_PORTRAIT, XPT2046_INV_LANDSCAPE may be used.
+        *cal*: calibration coefficients from affine(), rotation included; None derives them from *ranges* and *rot*
         '''
         self.buf = bytearray(3)
+        self.xs = array.array('H', bytes(2 * SAMPLES_MAX))
+        self.ys = array.array('H', bytes(2 * SAMPLES_MAX))
         self.spi = spi
         if isinstance(cs,int):
             self.cs = (machine.Pin(cs,machine.Pin.OUT))
@@ -84,75 +132,132 @@ class Xpt2046_hw(object):
         if bits not in (8,12):
             raise ValueError('Xpt2046.bits: must be 8 or 12 (not %s)'%str(bits))
         self.conv = (Xpt2046.CONV_8_BIT if bits==8 else Xpt2046.CONV_12_BIT)
+        self.z_min = Z_MIN if bits==12 else Z_MIN >> 4
         self.xy_range, self.dim, self.rot = ranges, (width, height), (rot % 4)
-        self.xy_scale = [self.dim[ax]*1./(self.xy_range[ax][1]-self.xy_range[ax][0]) for ax in (0,1)]
-        self.xy_origin = [self.xy_range[ax][0] for ax in (0,1)]
+        self.size = (height, width) if self.rot & 1 else (width, height)    # as LVGL sees it
+        self.raw = [0, 0]           # raw reading behind the last position, for calibration
+        self.cal = array.array('i', [0] * 6)
+        self.set_cal(cal or self.range_cal())
 
-    def _raw2px(self, rxy):
+    def range_cal(self):
+        'Coefficients equivalent to the linear *ranges* mapping in orientation *rot*.'
+        (x0, x1), (y0, y1) = self.xy_range
+        w, h = self.dim
+        sx, sy = w / (x1 - x0), h / (y1 - y0)
+        X = (sx, 0, -sx * x0)
+        Y = (0, sy, -sy * y0)
+        def flip(A, size):
+            return (-A[0], -A[1], size - A[2])
+        px, py = ((X, flip(Y, h)), (flip(Y, h), flip(X, w)), (flip(X, w), Y), (Y, X))[self.rot]
+        return tuple(round(v * (1 << CAL_SHIFT)) for v in px + py)
+
+    def set_cal(self, cal):
+        for i in range(6):
+            self.cal[i] = cal[i]
+
+    def _raw2px(self, rx, ry):
         'Convert raw coordinates to pixel coordinates'
-        x,y = [int(self.xy_scale[ax] * (rxy[ax] - self.xy_origin[ax])) for ax in (0,1)]
-        if   self.rot == 0:
-            return x, self.dim[1]-y
-        elif self.rot == 1:
-            return self.dim[1]-y, self.dim[0]-x
-        elif self.rot == 2:
-            return self.dim[0]-x, y
-        else:
-            return y, x
-
-    def _raw_pos(self):
-        'Read raw position; return value if within valid ranges (`__init__(ranges=...)`) or `None` if outside.'
-        ret = [0,0]
-        for ax,chan in [(0, Xpt2046.CHAN_X), (1,Xpt2046.CHAN_Y)]:
-            r = self._chanRead(chan)
-            if not self.xy_range[ax][0] <= r <= self.xy_range[ax][1]:
-                return None
-            ret[ax]=r
-        return ret
+        v = _affine(self.cal, rx, ry)
+        return min(v >> 16, self.size[0] - 1), min(v & 0xFFFF, self.size[1] - 1)
+
+    def pressed(self):
+        'Pen-down check in one transaction: Z1 stays near 0 without touch.'
+        return self._chanRead(Xpt2046.CHAN_Z1) > self.z_min
+
+    def _median(self, a, n):
+        'Median of a[:n], sorted in place.'
+        for i in range(1, n):
+            v = a[i]
+            j = i - 1
+            while j >= 0 and a[j] > v:
+                a[j + 1] = a[j]
+                j -= 1
+            a[j + 1] = v
+        return a[n >> 1]
+
+    def _settled(self, a, n):
+        'The last three samples of a[:n] lie within SPREAD.'
+        p, q, r = a[n - 3], a[n - 2], a[n - 1]
+        return max(p, q, r) - min(p, q, r) <= SPREAD
 
     def pos(self, N=10, attempts=20):
-        ''''
-        Get N position readings (limited by 20 attempts) and return mean position of valid readings.
-        If attempts are exhausted, return None.
         '''
-        N, attempts = 10, 20
-        xx, yy, done = 0, 0, 0
+        Position in pixels, or None if the pen is up. Up to *attempts* readings are taken until
+        *N* lie within the valid ranges, stopping as soon as the last three have settled; the
+        result is the median of those three or of all readings. Readings taken while the pen
+        was lifted are dropped by a second pressure check. Nothing is allocated until the
+        pixel tuple; the conversion is two fixed point multiply-adds per axis (see affine()).
+        '''
+        if not self.pressed():
+            return None
+        xs, ys = self.xs, self.ys
+        (xmin, xmax), (ymin, ymax) = self.xy_range
+        N = min(N, SAMPLES_MAX)
+        n = 0
         for _ in range(attempts):
-            if (r := self._raw_pos()) is None: continue
-            xx += r[0]; yy += r[1]; done += 1
-            if done == N: break
-        else: return None
-        mx, my = xx * 1. / N, yy * 1. / N
-        return self._raw2px((mx, my))
+            x = self._chanRead(Xpt2046.CHAN_X)
+            y = self._chanRead(Xpt2046.CHAN_Y)
+            if not (xmin <= x <= xmax and ymin <= y <= ymax):
+                continue
+            xs[n] = x
+            ys[n] = y
+            n += 1
+            if n >= 3 and self._settled(xs, n) and self._settled(ys, n):
+                xs[0], xs[1], xs[2] = xs[n - 3], xs[n - 2], xs[n - 1]
+                ys[0], ys[1], ys[2] = ys[n - 3], ys[n - 2], ys[n - 1]
+                n = 3
+                break
+            if n == N:
+                break
+        if n < 3 or not self.pressed():
+            return None
+        rx = self.raw[0] = self._median(xs, n)
+        ry = self.raw[1] = self._median(ys, n)
+        return self._raw2px(rx, ry)
 
 
 class Xpt2046(Xpt2046_hw):
     def indev_drv_read_cb(self, indev_drv, data):
-        # wait for DMA transfer (if any) before switchint SPI to 1 MHz
+        if self.penirq is not None and not self.pen_event and self.penirq.value():
+            data.state = 0          # pen up since the last read: no SPI at all
+            return
+        # wait for DMA transfer (if any) before switching a shared SPI bus to readRate
         if self.spiPrereadCb:
             self.spiPrereadCb()
-        # print('.',end='')
         if self.spiRate:
-            self.spi.init(baudrate=48_000_000)
+            self.spi.init(baudrate=self.readRate)
+        t0 = time.ticks_us()
         pos=self.pos()
+        PERF_TOUCH.add(time.ticks_diff(time.ticks_us(), t0))
+        # the conversions themselves pull PENIRQ low; only a touch during the next poll counts
+        self.pen_event = False
         if pos is None:
             data.state = 0
         else:
             (data.point.x,data.point.y), data.state = pos, 1
-        # print('#',end='')
         # switch SPI back to spiRate
         if self.spiRate:
             self.spi.init(baudrate = self.spiRate)
-            
-    def __init__(self, spi, spiRate=1_000_000, spiPrereadCb = None, **kw):
+
+    def penirq_cb(self, pin):
+        self.pen_event = True
+
+    def __init__(self, spi, spiRate=None, readRate=1_000_000, spiPrereadCb = None, penirq = None, **kw):
         '''XPT2046 touchscreen driver for LVGL; cf. documentation of :obj:`Xpt2046_hw` for the meaning of parameters being passed.
 
         *spiPrereadCb*: call this before reading from SPI; used to block until DMA transfer is complete (when sharing SPI bus).
-        *spiRate*: the SPI bus must set to low frequency (1MHz) when reading from the XPT2046; when *spiRate* is given, the bus will be switched back to this frequency when XPT2046 is done reading. The default 24MHz targets St77xx display chips which operate at that frequency and come often with XPT2046-based touchscreen.
+        *spiRate*: only for an SPI bus shared with the display: its rate, restored when the XPT2046 is done reading; the bus is set to *readRate* (at most 2MHz) for reading. None (default): the bus belongs to the XPT2046, runs at its rate already and is never reconfigured.
+        *penirq*: GPIO number of the PENIRQ line, if wired. While it is high and no touch was signalled since the last read, the read callback reports the released state without an SPI transaction.
         '''
         super().__init__(spi=spi, **kw)
         self.spiRate = spiRate
+        self.readRate = readRate
         self.spiPrereadCb = spiPrereadCb
+        self.pen_event = True
+        self.penirq = None
+        if penirq is not None:
+            self.penirq = machine.Pin(penirq, machine.Pin.IN, machine.Pin.PULL_UP)
+            self.penirq.irq(trigger=machine.Pin.IRQ_FALLING, handler=self.penirq_cb)
 
         import lvgl as lv
         if not lv.is_initialized(): lv.init()
@@ -0,0 +1,559 @@
+import machine
+import time
+import errno
+import array
+from micropython import const
+import freqfmt
+import perf
+
+STATUS_CTS    = const(0x80)
+STATUS_ERR    = const(0x40)
+STATUS_RSQINT = const(0x08)
+STATUS_RDSINT = const(0x04)
+STATUS_STCINT = const(0x01)
+
+CMD_TIMEOUT_MS      = const(100)
+POWER_UP_TIMEOUT_MS = const(1000)
+TUNE_TIMEOUT_MS     = const(500)
+POLL_MIN_US = const(200)
+POLL_MAX_US = const(1000)
+IRQ_SLICE_US = const(50)
+IRQ_BACKSTOP_US = const(10_000)
+# band switch: RCLK comes from the PIO (no crystal to settle), so POWER_DOWN and POWER_UP
+# complete with CTS. Only the external amplifiers get time, counted from the end of the tune.
+HP_UNMUTE_DELAY_MS = const(200)
+SP_UNMUTE_DELAY_MS = const(100)
+# status poll period: fast while the frequency moves (seek, step tuning), slow when parked
+STATUS_FAST_MS = const(100)
+STATUS_SLOW_MS = const(1000)
+# Si4735.func besides 0 (FM) and 1 (AM)
+FUNC_NONE    = const(-1)    # powered down: after a reset or POWER_DOWN
+FUNC_UNKNOWN = const(-2)    # a POWER_UP or switch failed halfway; POWER_DOWN first
+
+# Si4735.dirty bits, set when a status read changed the field
+DIRTY_FREQ    = const(0x01)
+DIRTY_RSSI    = const(0x02)
+DIRTY_SNR     = const(0x04)
+DIRTY_STBLEND = const(0x08)
+DIRTY_VALID   = const(0x10)
+DIRTY_ALL     = const(0x1F)
+
+MUTE_PROPERTY   = bytes([0x40, 0x01, 0x00, 0x03])   # RX_HARD_MUTE left and right
+UNMUTE_PROPERTY = bytes([0x40, 0x01, 0x00, 0x00])
+# RDS_CONFIG: RDSEN, every block kept; rds.Decoder drops bad blocks one by one
+RDS_CONFIG_PROPERTY = bytes([0x15, 0x02, 0xFF, 0x01])
+
+PERF_CMD = perf.hist('si.cmd')             # command to CTS, us
+PERF_POLLS = perf.hist('si.polls', '')      # status reads per wait for CTS/STC
+
+def printBytes(bs):
+    for i in range(len(bs)):
+        printHex(bs[i])
+    print()
+
+def printHex(h):
+    tbl = "0123456789ABCDEF"
+    r = h % 16
+    x = int(h / 16)
+    print(tbl[x], end="")
+    print(tbl[r], end="")
+    print(" ", end="")
+
+class Si4735(object):
+    mode = [
+        ['FM',  76000,108000, 10],
+        ['AM',    531,  1602,  9],
+        ['LW',    153,   279,  9],
+        ['120m', 2300,  2495,  5],
+        ['90m',  3200,  3400,  5],
+        ['75m',  3900,  4000,  5],
+        ['60m',  4750,  5060,  5],
+        ['49m',  5730,  6295,  5],
+        ['41m',  7100,  7600,  5],
+        ['31m',  9250,  9900,  5],
+        ['25m', 11600, 12100,  5],
+        ['22m', 13570, 13870,  5],
+        ['19m', 15030, 15800,  5],
+        ['16m', 17480, 17900,  5],
+        ['15m', 18900, 19020,  5],
+        ['13m', 21450, 21750,  5],
+        ['11m', 25670, 26100,  5],
+        ['SW',   2300, 26100,  5]
+    ]
+
+    def __init__(self, i2c, reset = 22, mutesp = None, mutehp = None, irq = None):
+        '''
+        *irq*: GPIO number or machine.Pin wired to GPO2/INT. When given, command completion
+        is signalled by the chip's interrupt line; otherwise the status byte is polled with
+        an exponentially growing interval.
+        '''
+        self.addr=0x63
+        self.i2c=i2c
+        self.reset = machine.Pin(reset, machine.Pin.OUT)
+        self.status = bytearray(1)
+        self.cmd = 0
+        self.latency = {}
+        self.polls = 0
+        self.intPending = False
+        self.intPin = irq
+        self.intFlags = 0
+        if self.intPin is not None:
+            if isinstance(self.intPin, int):
+                self.intPin = machine.Pin(self.intPin, machine.Pin.IN, machine.Pin.PULL_UP)
+            self.intPin.irq(handler=self.int_cb, trigger=machine.Pin.IRQ_FALLING)
+            self.intFlags = 0xC0            # CTSIEN | GPO2OEN in POWER_UP ARG1
+        self.mutesp = mutesp
+        self.mutehp = mutehp
+        self.propHits = 0
+        self.propMisses = 0
+        self.func = FUNC_NONE               # receiver powered up: 0 FM, 1 AM, or FUNC_*
+        self.switchMs = 0                   # duration of the last FM/AM switch, until mutesp released
+        self.hard_reset()
+        self.modeIdx = -1
+        self.freq = 0
+        self.fast = None
+        self.rssi = 0
+        self.snr = 0
+        self.stblend = 0
+        self.valid = 0
+        self.seeking = False
+        self.dirty = DIRTY_ALL
+        self.segLo = self.segHi = 0         # band plan segment cached by stepModeIdx
+        self.segMode = -1
+
+    def getModeIdx(self, khz):
+        return BAND_OWNER[bandSegment(khz)]
+
+    def stepModeIdx(self, khz):
+        'getModeIdx for step tuning: the band plan is searched only when a band edge was crossed.'
+        if khz < self.segLo or khz >= self.segHi:
+            self.segLo = bandEdgeBelow(khz)
+            hi = bandEdgeAbove(khz)
+            self.segHi = hi if hi >= 0 else 0x7FFFFFFF
+            self.segMode = bandIndex(khz)
+        return self.segMode
+
+    def hard_reset(self):
+        if self.reset:
+            for val in (1, 0, 1):
+                self.reset.value(val)
+                time.sleep(0.1)
+            time.sleep(0.1)
+        self.func = FUNC_NONE
+        self.invalidateProperties()
+
+    def invalidateProperties(self):
+        'Forget the shadow of written properties; the chip is back to its defaults.'
+        self.propCache = {}
+
+    def propertyCached(self, buf):
+        'True if the chip already has the value of property *buf* (property id + value, 2 bytes each).'
+        if self.propCache.get((buf[0] << 8) | buf[1]) == (buf[2] << 8) | buf[3]:
+            self.propHits += 1
+            return True
+        self.propMisses += 1
+        return False
+
+    def propertyWritten(self, buf):
+        self.propCache[(buf[0] << 8) | buf[1]] = (buf[2] << 8) | buf[3]
+
+    def setProperty(self, buf=None):
+        if self.propertyCached(buf):
+            return
+        self.buf = bytes([0x12, 0x00]) + buf
+        self.command(self.buf)
+        self.propertyWritten(buf)
+        
+    def getProperty(self, buf=None):
+        self.command(bytes([0x13, 0x00]) + buf)
+        self.resp = self.i2c.readfrom(self.addr, 4)
+        print("getProperty: ",end="")
+        printBytes(self.resp)
+
+    def powerUpCommand(self, func):
+        'POWER_UP command for *func* 0 (FM receive) or 1 (AM/SW/LW receive).'
+        return bytes([0x01, func | self.intFlags, 0x05])     # analog Out
+#         return bytes([0x01, func | self.intFlags, 0xB0])     # I2S
+
+    def powerUpProperties(self):
+        props = [bytes([0xFF, 0x00, 0x00, 0x00])]             # Turn off Debug Mode
+#         props.append(bytes([0x01, 0x04, 0xBB, 0x80]))         # I2S sample rate
+        if self.intPin:
+            props.append(bytes([0x00, 0x01, 0x00, 0x81]))      # GPO_IEN: CTSIEN | STCIEN
+        return props
+
+    def FMPOWER_UP(self):
+        self.func = FUNC_UNKNOWN
+        self.command(self.powerUpCommand(0x00), POWER_UP_TIMEOUT_MS)
+        self.func = 0
+        for buf in self.powerUpProperties():
+            self.setProperty(buf)
+
+    def FM_SEEK_BAND_BOTTOM(self, freq):
+        self.setProperty(bytes([0x14, 0x00]) + freq.to_bytes(2, 'big'))
+
+    def FM_SEEK_BAND_TOP(self, freq):
+        self.setProperty(bytes([0x14, 0x01]) + freq.to_bytes(2, 'big'))
+
+    def FM_SEEK_FREQ_SPACING(self, step):
+        self.setProperty(bytes([0x14, 0x02, 0x00]) + step.to_bytes(1, 'big')) # 5(50kHz), 10(100kHz), 20(200kHz)
+
+    def AMPOWER_UP(self):
+        self.func = FUNC_UNKNOWN
+        self.command(self.powerUpCommand(0x01), POWER_UP_TIMEOUT_MS)
+        self.func = 1
+        for buf in self.powerUpProperties():
+            self.setProperty(buf)
+
+    def AM_SEEK_BAND_BOTTOM(self, freq):
+        self.setProperty(bytes([0x34, 0x00]) + freq.to_bytes(2, 'big'))
+
+    def AM_SEEK_BAND_TOP(self, freq):
+        self.setProperty(bytes([0x34, 0x01]) + freq.to_bytes(2, 'big'))
+
+    def AM_SEEK_FREQ_SPACING(self, step):
+        self.setProperty(bytes([0x34, 0x02, 0x00]) + step.to_bytes(1, 'big')) # 1 (1kHz), 5 (5kHz), 9 (9kHz), and 10 (10kHz).
+
+    def POWER_DOWN(self):
+        self.command(bytes([0x11]))
+        self.func = FUNC_NONE
+        self.invalidateProperties()
+    
+    def setFMDeEmphasis(self):
+        self.setProperty(bytes([0x11, 0x00, 0x00, 0x01]))  # 01 = 50 μs. Used in Europe, Australia, Japan
+
+    def bandProperties(self, modeIdx):
+        'Properties set for every tune in band *modeIdx*: de-emphasis (FM) and seek band bottom, top and spacing.'
+        m = self.mode[modeIdx]
+        if modeIdx == 0:
+            return [bytes([0x11, 0x00, 0x00, 0x01]),
+                    RDS_CONFIG_PROPERTY,
+                    bytes([0x14, 0x00]) + int(m[1] / 10).to_bytes(2, 'big'),
+                    bytes([0x14, 0x01]) + int(m[2] / 10).to_bytes(2, 'big'),
+                    bytes([0x14, 0x02, 0x00]) + m[3].to_bytes(1, 'big')]
+        return [bytes([0x34, 0x00]) + int(m[1]).to_bytes(2, 'big'),
+                bytes([0x34, 0x01]) + int(m[2]).to_bytes(2, 'big'),
+                bytes([0x34, 0x02, 0x00]) + m[3].to_bytes(1, 'big')]
+
+    def tuneCommand(self, cmd, freq, fast=None):
+        if freq != self.freq:
+            self.dirty |= DIRTY_FREQ
+        self.freq=freq
+        self.fast=fast
+        self.seeking = False
+        param = bytes([cmd, 0x00]) if fast == None else bytes([cmd, 0x01])
+        return param + freq.to_bytes(2, 'big')
+
+    def FM_TUNE_FREQ(self, freq, fast=None):
+        self.command(self.tuneCommand(0x20, freq, fast))
+
+    def AM_TUNE_FREQ(self, freq, fast=None):
+        self.command(self.tuneCommand(0x40, freq, fast))
+
+    def seekCommand(self, cmd, seekDir):
+        arg1 = 0b00001100 if seekDir == 1 else 0b00000100
+        self.seeking = True
+        return bytes([cmd, arg1])
+
+    def FM_SEEK_START(self, seekDir):
+        self.command(self.seekCommand(0x21, seekDir))
+
+    def AM_SEEK_START(self, seekDir):
+        self.command(self.seekCommand(0x41, seekDir))
+
+    def parseTuneStatus(self, resp):
+        freq = resp[2] * 256 + resp[3]
+        if freq != self.freq:
+            self.freq = freq
+            self.dirty |= DIRTY_FREQ
+        if resp[0] & STATUS_STCINT:
+            self.seeking = False
+        self.parseSignal(resp[4], resp[5], resp[1] & 0b0000_0001)
+
+    def parseRsqStatus(self, resp):
+        stblend = resp[3] & 0x7f
+        if stblend != self.stblend:
+            self.stblend = stblend
+            self.dirty |= DIRTY_STBLEND
+        self.parseSignal(resp[4], resp[5], resp[2] & 0b0000_0001)
+
+    def parseSignal(self, rssi, snr, valid):
+        if rssi != self.rssi:
+            self.rssi = rssi
+            self.dirty |= DIRTY_RSSI
+        if snr != self.snr:
+            self.snr = snr
+            self.dirty |= DIRTY_SNR
+        if valid != self.valid:
+            self.valid = valid
+            self.dirty |= DIRTY_VALID
+
+    def takeDirty(self):
+        'Return and clear the DIRTY_* bits collected since the last call.'
+        dirty = self.dirty
+        self.dirty = 0
+        return dirty
+
+    def statusPeriod(self):
+        'Status poll period in ms: STATUS_FAST_MS while seeking or step tuning.'
+        return STATUS_FAST_MS if self.seeking or self.fast == True else STATUS_SLOW_MS
+
+    def FM_TUNE_STATUS(self):
+        self.command(bytes([0x22, 0x00]))
+        self.parseTuneStatus(self.i2c.readfrom(self.addr, 7))
+
+    def AM_TUNE_STATUS(self):
+        self.command(bytes([0x42, 0x00]))
+        self.parseTuneStatus(self.i2c.readfrom(self.addr, 7))
+
+    def FM_RSQ_STATUS(self):
+        self.command(bytes([0x23, 0x00]))
+        self.parseRsqStatus(self.i2c.readfrom(self.addr, 7))
+
+    def AM_RSQ_STATUS(self):
+        self.command(bytes([0x43, 0x00]))
+        self.parseRsqStatus(self.i2c.readfrom(self.addr, 7))
+
+    def volumeProperty(self, vol):
+        self.vol = vol
+        if self.vol > 63:
+            self.vol = 63
+        return bytes([0x40, 0x00]) + self.vol.to_bytes(2, 'big')
+
+    def setVolume(self, vol):
+        self.setProperty(self.volumeProperty(vol))
+
+    def unmute(self):
+        self.setProperty(UNMUTE_PROPERTY)
+
+    def mute(self):
+        self.setProperty(MUTE_PROPERTY)
+
+    def int_cb(self, pin):
+        # Can be called in interrupt context
+        self.intPending = True
+
+    def command(self, buf, timeout_ms=CMD_TIMEOUT_MS):
+        'Send a command and wait for CTS; the time until CTS is kept in self.latency[cmd] (us).'
+        self.cmd = buf[0]
+        self.intPending = False
+        t0 = time.ticks_us()
+        self.i2c.writeto(self.addr, buf)
+        self.waitStatus(STATUS_CTS, timeout_ms)
+        dt = self.latency[self.cmd] = time.ticks_diff(time.ticks_us(), t0)
+        PERF_CMD.add(dt)
+
+    def waitCTS(self, timeout_ms=CMD_TIMEOUT_MS):
+        return self.waitStatus(STATUS_CTS, timeout_ms)
+
+    def waitSTC(self, timeout_ms=TUNE_TIMEOUT_MS):
+        'Wait for the end of a tune or seek. STCINT stays set until the next TUNE_STATUS with INTACK.'
+        return self.waitStatus(STATUS_STCINT, timeout_ms)
+
+    def pollStatus(self, mask):
+        'Read the status byte once; True if all *mask* bits are set, OSError(EIO) on ERR.'
+        self.i2c.readfrom_into(self.addr, self.status)
+        self.polls += 1
+        st = self.status[0]
+        if st & STATUS_ERR and st & STATUS_CTS:
+            raise OSError(errno.EIO)
+        return st & mask == mask
+
+    def waitStatus(self, mask, timeout_ms):
+        '''
+        Wait until the status byte has all *mask* bits set and return it.
+        Raises OSError(ETIMEDOUT) after *timeout_ms* and OSError(EIO) if the chip reports ERR.
+        '''
+        t0 = time.ticks_us()
+        timeout_us = timeout_ms * 1000
+        delay = POLL_MIN_US
+        polls = self.polls
+        while True:
+            if self.pollStatus(mask):
+                PERF_POLLS.add(self.polls - polls)
+                return self.status[0]
+            waited = time.ticks_diff(time.ticks_us(), t0)
+            if waited > timeout_us:
+                raise OSError(errno.ETIMEDOUT)
+            if self.intPin:
+                # sleep until the INT line fires; the status poll is only a backstop
+                delay = min(IRQ_BACKSTOP_US, timeout_us - waited + 1)
+                slept = 0
+                while not self.intPending and slept < delay:
+                    time.sleep_us(IRQ_SLICE_US)
+                    slept += IRQ_SLICE_US
+                self.intPending = False
+            else:
+                time.sleep_us(min(delay, timeout_us - waited + 1))
+                delay = min(delay * 2, POLL_MAX_US)
+
+    def getFmFreqStr(self):
+        return freqfmt.freqText(self.freq * 10)
+
+    def getAmFreqStr(self):
+        return freqfmt.freqText(self.freq)
+
+    def getFreqStr(self):
+        'Frequency text of the current mode, e.g. 88.1MHz or 954kHz; cached, no float math.'
+        return freqfmt.freqText(self.khz())
+
+    def khz(self, freq = None):
+        'kHz of *freq* in chip units of the current band (10kHz in FM, kHz otherwise), default self.freq.'
+        if freq is None:
+            freq = self.freq
+        return freq * 10 if self.modeIdx == 0 else freq
+
+    def muteAudio(self):
+        if self.mutesp: self.mutesp.value(1)
+        if self.mutehp: self.mutehp.value(1)
+
+    def unmuteAudio(self):
+        '''
+        Release the headphone, then the speaker amplifier, once the tune has completed. Sleeps
+        HP_UNMUTE_DELAY_MS + SP_UNMUTE_DELAY_MS: blocking path, for the host bench and the
+        REPL only; main.py tunes through Si4735Async, whose astagedUnmute does not block.
+        '''
+        self.waitSTC()
+        time.sleep_ms(HP_UNMUTE_DELAY_MS)
+        if self.mutehp: self.mutehp.value(0)
+        time.sleep_ms(SP_UNMUTE_DELAY_MS)
+        if self.mutesp: self.mutesp.value(0)
+
+    def bandSwitch(self, newMode):
+        'True if tuning into band *newMode* needs a POWER_DOWN and POWER_UP of the other receiver.'
+        return self.func != (0 if newMode == 0 else 1)
+
+    def tune(self, fkhz, vol):
+        '''
+        Tune to *fkhz* kHz, switching between FM and AM power-up modes when needed,
+        and return the new mode index (-1 if *fkhz* is outside every band). A switch blocks
+        in unmuteAudio(); not for the UI, which uses Si4735Async.requestTune.
+        '''
+        newMode = self.getModeIdx(fkhz)
+        if newMode < 0:
+            return newMode
+        modeChange = self.bandSwitch(newMode)
+        if modeChange:
+            t0 = time.ticks_ms()
+            self.muteAudio()
+            if self.func != FUNC_NONE:      # a chip that is down answers POWER_DOWN with ERR
+                self.POWER_DOWN()
+            if newMode == 0:
+                self.FMPOWER_UP()
+            else:
+                self.AMPOWER_UP()
+        self.mute()
+        self.modeIdx = newMode
+        for buf in self.bandProperties(newMode):
+            self.setProperty(buf)
+        if newMode == 0:
+            self.FM_TUNE_FREQ(int(fkhz / 10))
+        else:
+            self.AM_TUNE_FREQ(fkhz)
+        self.setVolume(vol)
+        self.unmute()
+        if modeChange:
+            self.unmuteAudio()
+            self.switchMs = time.ticks_diff(time.ticks_ms(), t0)
+        return newMode
+
+    def stepTune(self, step):
+        '''
+        Fast-tune *step* channels (10kHz units on FM, kHz otherwise) away from the current frequency.
+        Return True if the new frequency was in range and has been tuned.
+        '''
+        newFreq = self.stepFreq(step)
+        if newFreq < 0:
+            return False
+        if self.modeIdx == 0:
+            self.FM_TUNE_FREQ(newFreq, fast = True)
+        else:
+            self.modeIdx = self.stepModeIdx(newFreq)
+            self.AM_TUNE_FREQ(newFreq, fast = True)
+        return True
+
+    def stepFreq(self, step):
+        'Chip frequency *step* channels away from the current one, or -1 if that is out of range.'
+        newFreq = self.freq + step
+        if self.modeIdx == 0:
+            if newFreq * 10 >= self.mode[0][1] and newFreq * 10 <= self.mode[0][2]:
+                return newFreq
+        else:
+            if newFreq >= 149 and newFreq <= 23000:
+                return newFreq
+        return -1
+
+    def seek(self, seekDir):
+        if self.modeIdx == 0:
+            self.FM_SEEK_START(seekDir)
+        elif self.modeIdx > 0:
+            self.AM_SEEK_START(seekDir)
+
+    def updateStatus(self):
+        '''
+        Refresh rssi, snr, stblend and valid from RSQ_STATUS. The frequency only moves during
+        a seek, so TUNE_STATUS is read only until the seek has completed.
+        '''
+        if self.modeIdx == 0:
+            if self.seeking: self.FM_TUNE_STATUS()
+            self.FM_RSQ_STATUS()
+        else:
+            if self.seeking: self.AM_TUNE_STATUS()
+            self.AM_RSQ_STATUS()
+
+    def finishFastTune(self):
+        'Re-tune without the FAST flag so that the chip settles after step tuning.'
+        if self.fast == True:
+            if self.modeIdx == 0:
+                self.FM_TUNE_FREQ(self.freq)
+            else:
+                self.AM_TUNE_FREQ(self.freq)
+
+
+def buildBandPlan(modes):
+    '''
+    Split the kHz axis at every band edge of *modes* and give each piece to the narrowest band
+    covering it (the earlier one of equally wide bands), so that e.g. 9500kHz is '31m' and not
+    the 'SW' catch-all whatever the order of the table. Returns the piece start frequencies and
+    their mode index (-1 outside every band), neighbouring pieces of the same band merged.
+    '''
+    cuts = sorted(set([0] + [m[1] for m in modes] + [m[2] + 1 for m in modes]))
+    edges = array.array('I')
+    owner = array.array('b')
+    for lo in cuts:
+        best = -1
+        for i in range(len(modes)):
+            m = modes[i]
+            if m[1] <= lo <= m[2] and (best < 0 or m[2] - m[1] < modes[best][2] - modes[best][1]):
+                best = i
+        if len(owner) == 0 or owner[-1] != best:
+            edges.append(lo)
+            owner.append(best)
+    return edges, owner
+
+BAND_EDGES, BAND_OWNER = buildBandPlan(Si4735.mode)
+
+def bandSegment(khz):
+    'Index of the band plan piece holding *khz* (binary search, MicroPython has no bisect).'
+    lo = 0
+    hi = len(BAND_EDGES) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if BAND_EDGES[mid] <= khz:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def bandIndex(khz):
+    'Mode index of *khz*, -1 if it is outside every band.'
+    return BAND_OWNER[bandSegment(khz)]
+
+def bandEdgeAbove(khz):
+    'Lowest frequency above *khz* where the band changes, -1 if there is none.'
+    i = bandSegment(khz) + 1
+    return BAND_EDGES[i] if i < len(BAND_EDGES) else -1
+
+def bandEdgeBelow(khz):
+    'Lowest frequency of the band plan piece holding *khz*: stepping below it changes the band.'
+    return BAND_EDGES[bandSegment(khz)]
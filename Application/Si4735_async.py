@@ -0,0 +1,379 @@
+import time
+import errno
+import uasyncio
+from micropython import const
+import Si4735
+import rds
+from Si4735 import STATUS_CTS, STATUS_STCINT, CMD_TIMEOUT_MS, POWER_UP_TIMEOUT_MS, TUNE_TIMEOUT_MS
+from Si4735 import MUTE_PROPERTY, UNMUTE_PROPERTY, HP_UNMUTE_DELAY_MS, SP_UNMUTE_DELAY_MS
+from Si4735 import STATUS_FAST_MS, DIRTY_FREQ, FUNC_NONE, FUNC_UNKNOWN
+
+POLL_MIN_MS = const(1)
+POLL_MAX_MS = const(4)
+IRQ_BACKSTOP_MS = const(10)
+FAST_TUNE_SETTLE_MS = const(500)    # no step for this long: re-tune without FAST
+SCAN_DWELL_MS = const(5)            # RSQ averaging after a FAST tune of a scan channel
+SEEK_POLL_MS = const(50)            # progress reads while an ATS seek runs
+RDS_RESP_LEN = const(13)
+RDS_STATUS_ONLY = bytes([0x24, 0x04])       # FM_RDS_STATUS: STATUSONLY, FIFO untouched
+RDS_POP = bytes([0x24, 0x01])               # FM_RDS_STATUS: INTACK, oldest group out of the FIFO
+
+# FM/AM switch states, see Si4735Async.atune
+SW_IDLE       = const(0)
+SW_POWER_DOWN = const(1)
+SW_POWER_UP   = const(2)
+SW_PROPERTIES = const(3)
+SW_TUNE       = const(4)
+SW_UNMUTE     = const(5)
+SW_STATES = ('idle', 'power down', 'power up', 'properties', 'tune', 'unmute')
+
+
+class Request(object):
+    'A queued driver operation; *done* is set when it has been executed.'
+    def __init__(self, key, op, args):
+        self.key = key
+        self.op = op
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = uasyncio.Event()
+
+    async def wait(self):
+        await self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Si4735Async(Si4735.Si4735):
+    '''
+    Si4735 driver for uasyncio: the request* methods only queue an operation and return a
+    Request, a background task executes the queue and awaits CTS instead of sleeping.
+    Queued requests with the same key collapse to the latest one, so a burst of step tunes or
+    volume changes costs a single I2C command.
+
+    The blocking methods of Si4735 may still be used before the event loop is started.
+    '''
+    def __init__(self, i2c, reset = 22, mutesp = None, mutehp = None, irq = None):
+        super().__init__(i2c, reset, mutesp, mutehp, irq)
+        self.queue = []
+        self.current = None
+        self.errors = 0
+        self.switchState = SW_IDLE
+        self.switchStart = 0
+        self.stateStart = 0
+        self.switchPhases = [0] * len(SW_STATES)   # ms spent in each state by the last switch
+        self.unmuteGen = 0
+        self.stepAt = 0
+        self.wake = uasyncio.Event()
+        self.rds = rds.GroupRing()
+        self.rdsResp = bytearray(RDS_RESP_LEN)
+        self.sweeping = False               # a band scan or ATS has the tuner, see aborrow
+        self.loanKhz = 0
+        self.loanAt = 0
+        self.task = uasyncio.create_task(self.worker())
+
+    # -- queue --------------------------------------------------------------
+
+    def submit(self, key, op, *args):
+        'Queue *op(*args)*; an already queued request with the same *key* gets the new op instead.'
+        if key is not None:
+            for req in self.queue:
+                if req.key == key:
+                    req.op, req.args = op, args
+                    return req
+        req = Request(key, op, args)
+        self.queue.append(req)
+        self.wake.set()
+        return req
+
+    def pending(self, key):
+        for req in self.queue:
+            if req.key == key:
+                return True
+        return False
+
+    def busy(self):
+        'True while a request is queued or being executed.'
+        return self.current is not None or len(self.queue) > 0
+
+    async def worker(self):
+        while True:
+            if not self.queue:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            req = self.current = self.queue.pop(0)
+            try:
+                req.result = await req.op(*req.args)
+            except Exception as e:
+                req.error = e
+                self.errors += 1
+                print('Si4735:', repr(e))
+            self.current = None
+            req.done.set()
+
+    # -- requests used by the UI --------------------------------------------
+
+    def requestTune(self, fkhz, vol):
+        '''
+        Queue a tune to *fkhz* kHz; returns None if *fkhz* is outside every band.
+        modeIdx and freq move to the target at once; the tune supersedes queued step tunes.
+        '''
+        newMode = self.getModeIdx(fkhz)
+        if newMode < 0:
+            return None
+        self.queue = [req for req in self.queue if req.key != 'step']
+        self.modeIdx = newMode
+        self.freq = int(fkhz / 10) if newMode == 0 else fkhz
+        self.fast = None
+        self.seeking = False
+        self.dirty |= DIRTY_FREQ
+        return self.submit('tune', self.atune, fkhz, vol)
+
+    def requestStep(self, step):
+        'Queue a fast tune *step* channels away; self.freq follows at once so that steps add up.'
+        newFreq = self.stepFreq(step)
+        if newFreq < 0:
+            return None
+        if self.modeIdx != 0:
+            self.modeIdx = self.stepModeIdx(newFreq)
+        self.stepAt = time.ticks_ms()
+        for req in self.queue:
+            if req.key == 'tune':
+                # not tuned yet: move the target of the queued tune instead
+                self.freq = newFreq
+                self.dirty |= DIRTY_FREQ
+                req.args = (self.khz(newFreq), req.args[1])
+                return req
+        buf = self.tuneCommand(0x20 if self.modeIdx == 0 else 0x40, newFreq, True)
+        return self.submit('step', self.acommand, buf)
+
+    def requestFinishFastTune(self):
+        'Queue the final (not FAST) tune once no step came for FAST_TUNE_SETTLE_MS.'
+        if self.fast != True or self.pending('step'):
+            return None
+        if time.ticks_diff(time.ticks_ms(), self.stepAt) < FAST_TUNE_SETTLE_MS:
+            return None
+        buf = self.tuneCommand(0x20 if self.modeIdx == 0 else 0x40, self.freq)
+        return self.submit('step', self.acommand, buf)
+
+    def requestSeek(self, seekDir):
+        return self.submit('seek', self.aseek, seekDir)
+
+    def requestVolume(self, vol):
+        return self.submit('vol', self.asetProperty, self.volumeProperty(vol))
+
+    def requestMute(self):
+        return self.submit('mute', self.asetProperty, MUTE_PROPERTY)
+
+    def requestStatus(self):
+        return self.submit('status', self.aupdateStatus)
+
+    async def aborrow(self, fkhz, vol):
+        '''
+        Take the tuner for a band scan or ATS sweep: tune to *fkhz* kHz and mute. Status and
+        RDS reads pause until giveBack(), so the channels swept never reach the MAIN tab.
+        '''
+        self.sweeping = True
+        self.loanKhz = self.khz()
+        req = self.requestTune(fkhz, vol)
+        self.loanAt = self.khz()
+        await req.wait()
+        await self.requestMute().wait()
+
+    def giveBack(self, vol):
+        'End the sweep of aborrow() and tune back, unless the user tuned elsewhere meanwhile.'
+        self.sweeping = False
+        if self.khz() == self.loanAt and self.getModeIdx(self.loanKhz) >= 0:
+            self.requestTune(self.loanKhz, vol)
+
+    # -- operations executed by the worker ----------------------------------
+
+    async def acommand(self, buf, timeout_ms=CMD_TIMEOUT_MS):
+        self.cmd = buf[0]
+        self.intPending = False
+        t0 = time.ticks_us()
+        self.i2c.writeto(self.addr, buf)
+        await self.awaitStatus(STATUS_CTS, timeout_ms)
+        dt = self.latency[self.cmd] = time.ticks_diff(time.ticks_us(), t0)
+        Si4735.PERF_CMD.add(dt)
+
+    async def awaitStatus(self, mask, timeout_ms):
+        'Like Si4735.waitStatus, but other tasks run while the chip is busy.'
+        t0 = time.ticks_ms()
+        delay = POLL_MIN_MS
+        polls = self.polls
+        while True:
+            if self.pollStatus(mask):
+                Si4735.PERF_POLLS.add(self.polls - polls)
+                return self.status[0]
+            if time.ticks_diff(time.ticks_ms(), t0) > timeout_ms:
+                raise OSError(errno.ETIMEDOUT)
+            if self.intPin:
+                slept = 0
+                while not self.intPending and slept < IRQ_BACKSTOP_MS:
+                    await uasyncio.sleep_ms(POLL_MIN_MS)
+                    slept += POLL_MIN_MS
+                self.intPending = False
+            else:
+                await uasyncio.sleep_ms(delay)
+                delay = min(delay * 2, POLL_MAX_MS)
+
+    async def asetProperty(self, buf):
+        if self.propertyCached(buf):
+            return
+        await self.acommand(bytes([0x12, 0x00]) + buf)
+        self.propertyWritten(buf)
+
+    def enterState(self, state):
+        'Move the FM/AM switch to *state*, booking the time spent in the previous one.'
+        now = time.ticks_ms()
+        if self.switchState != SW_IDLE:
+            self.switchPhases[self.switchState] = time.ticks_diff(now, self.stateStart)
+        if state == SW_IDLE:
+            self.switchMs = time.ticks_diff(now, self.switchStart)
+        elif self.switchState == SW_IDLE or self.switchState == SW_UNMUTE:
+            self.switchStart = now
+            for i in range(len(self.switchPhases)):
+                self.switchPhases[i] = 0
+        self.switchState = state
+        self.stateStart = now
+
+    async def atune(self, fkhz, vol):
+        '''
+        Tune to *fkhz* kHz. An FM/AM switch walks through the SW_* states: power down and
+        power up end with CTS, the tune with STC, and the amplifiers are released by a
+        separate timed task so that the queue is free again as soon as the chip is tuned.
+        A switch that fails on the way goes back to SW_IDLE and is redone by the next tune.
+        '''
+        newMode = self.getModeIdx(fkhz)
+        modeChange = self.bandSwitch(newMode)
+        try:
+            if modeChange:
+                self.unmuteGen += 1             # stops a staged unmute of a previous switch
+                self.muteAudio()
+                self.enterState(SW_POWER_DOWN)
+                if self.func != FUNC_NONE:  # a chip that is down answers POWER_DOWN with ERR
+                    await self.acommand(bytes([0x11]))
+                    self.func = FUNC_NONE
+                self.invalidateProperties()
+                self.enterState(SW_POWER_UP)
+                func = 0 if newMode == 0 else 1
+                self.func = FUNC_UNKNOWN
+                await self.acommand(self.powerUpCommand(func), POWER_UP_TIMEOUT_MS)
+                self.func = func
+                self.enterState(SW_PROPERTIES)
+                for buf in self.powerUpProperties():
+                    await self.asetProperty(buf)
+            await self.asetProperty(MUTE_PROPERTY)
+            self.modeIdx = newMode
+            for buf in self.bandProperties(newMode):
+                await self.asetProperty(buf)
+            if modeChange:
+                self.enterState(SW_TUNE)
+            if newMode == 0:
+                await self.acommand(self.tuneCommand(0x20, int(fkhz / 10)))
+            else:
+                await self.acommand(self.tuneCommand(0x40, fkhz))
+            await self.asetProperty(self.volumeProperty(vol))
+            await self.asetProperty(UNMUTE_PROPERTY)
+            if modeChange:
+                await self.awaitStatus(STATUS_STCINT, TUNE_TIMEOUT_MS)
+                self.enterState(SW_UNMUTE)
+                uasyncio.create_task(self.astagedUnmute(self.unmuteGen))
+        except Exception:
+            if modeChange:
+                # the chip is in an unknown state: the next tune walks the whole switch again
+                self.func = FUNC_UNKNOWN
+                self.enterState(SW_IDLE)
+            raise
+        return newMode
+
+    async def astagedUnmute(self, gen):
+        await uasyncio.sleep_ms(HP_UNMUTE_DELAY_MS)
+        if gen != self.unmuteGen:
+            return
+        if self.mutehp: self.mutehp.value(0)
+        await uasyncio.sleep_ms(SP_UNMUTE_DELAY_MS)
+        if gen != self.unmuteGen:
+            return
+        if self.mutesp: self.mutesp.value(0)
+        self.enterState(SW_IDLE)
+
+    async def aseek(self, seekDir):
+        if self.modeIdx == 0:
+            await self.acommand(self.seekCommand(0x21, seekDir))
+        elif self.modeIdx > 0:
+            await self.acommand(self.seekCommand(0x41, seekDir))
+
+    async def ascanChannel(self, freq):
+        '''
+        Measure channel *freq* (chip units) for a band scan; returns (rssi, snr). The tune
+        status of a FAST tune is not accurate, so the signal is taken from RSQ_STATUS after
+        SCAN_DWELL_MS. self.freq stays where it is.
+        '''
+        base = 0x20 if self.modeIdx == 0 else 0x40
+        await self.acommand(bytes([base, 0x01, freq >> 8, freq & 0xFF]))
+        await self.awaitStatus(STATUS_STCINT, TUNE_TIMEOUT_MS)
+        await self.acommand(bytes([base + 0x02, 0x01]))     # INTACK clears STCINT for the next channel
+        await uasyncio.sleep_ms(SCAN_DWELL_MS)
+        await self.acommand(bytes([base + 0x03, 0x00]))
+        resp = self.i2c.readfrom(self.addr, 7)
+        return resp[4], resp[5]
+
+    async def aseekStation(self, progress=None):
+        '''
+        Seek up to the next station without wrapping, for ATS; returns the TUNE_STATUS
+        response (BLTF set: the band top was reached). The channel passed is read every
+        SEEK_POLL_MS for *progress(freq)*; the seek times out only if it stops moving.
+        self.freq stays where it is.
+        '''
+        base = 0x21 if self.modeIdx == 0 else 0x41
+        await self.acommand(bytes([base, 0b00001000]))
+        t0 = time.ticks_ms()
+        last = -1
+        while not self.pollStatus(STATUS_STCINT):
+            await uasyncio.sleep_ms(SEEK_POLL_MS)
+            await self.acommand(bytes([base + 0x01, 0x00]))
+            resp = self.i2c.readfrom(self.addr, 7)
+            freq = resp[2] * 256 + resp[3]
+            if freq != last:
+                last = freq
+                t0 = time.ticks_ms()
+                if progress:
+                    progress(freq)
+            elif time.ticks_diff(time.ticks_ms(), t0) > TUNE_TIMEOUT_MS:
+                raise OSError(errno.ETIMEDOUT)
+        await self.acommand(bytes([base + 0x01, 0x01]))     # INTACK
+        return self.i2c.readfrom(self.addr, 7)
+
+    def statusPeriod(self):
+        if self.switchState != SW_IDLE:
+            return STATUS_FAST_MS
+        return super().statusPeriod()
+
+    async def aupdateStatus(self):
+        if self.sweeping or self.pending('tune'):
+            return                              # the chip is not (yet) on self.freq
+        base = 0x20 if self.modeIdx == 0 else 0x40
+        if self.seeking:
+            await self.acommand(bytes([base + 0x02, 0x00]))
+            resp = self.i2c.readfrom(self.addr, 7)
+            # a tune queued meanwhile already moved self.freq to its target
+            if not self.pending('tune') and not self.pending('step'):
+                self.parseTuneStatus(resp)
+        await self.acommand(bytes([base + 0x03, 0x00]))
+        self.parseRsqStatus(self.i2c.readfrom(self.addr, 7))
+        if self.func == 0 and self.valid and not self.seeking and self.fast is None:
+            await self.ardsDrain()              # no RDS to read while the frequency moves
+
+    async def ardsDrain(self):
+        'Move the groups waiting in the chip RDS FIFO into self.rds, reading into one buffer.'
+        resp = self.rdsResp
+        await self.acommand(RDS_STATUS_ONLY)
+        self.i2c.readfrom_into(self.addr, resp)
+        for i in range(resp[3]):                    # RDSFIFOUSED
+            await self.acommand(RDS_POP)
+            self.i2c.readfrom_into(self.addr, resp)
+            self.rds.put(resp)
@@ -0,0 +1,119 @@
+import os
+import array
+import uasyncio
+from micropython import const
+import freqfmt
+
+ATS_MAX = const(64)             # stations kept by one sweep
+ATS_AREA = 'A'                  # writes A.txt, opened by the A button of the Station tab
+
+class Ats(object):
+    '''
+    Automatic station store: seeks a band of the Si4735.mode table from bottom to top through a
+    Si4735Async radio and keeps every valid station with its RSSI/SNR, at most *maxStations*.
+    A hit one channel above the previous one is the same station heard off-frequency; only the
+    stronger of the two is kept. A finished sweep is written to the area file *area*.txt.
+    *progress_cb(ats)* is called while the seek moves and once when the sweep ends.
+    '''
+    def __init__(self, radio, progress_cb=None, area=ATS_AREA, maxStations=ATS_MAX):
+        self.radio = radio
+        self.progress_cb = progress_cb
+        self.area = area
+        self.khz = array.array('I', [0] * maxStations)
+        self.rssi = array.array('B', bytes(maxStations))
+        self.snr = array.array('B', bytes(maxStations))
+        self.count = 0
+        self.modeIdx = -1
+        self.freq = 0                   # kHz the seek has reached
+        self.running = False
+        self.done = False               # the band was swept to the top, or the store is full
+        self.task = None
+
+    def progress(self):
+        'Percent of the band swept.'
+        name, lo, hi, step = self.radio.mode[self.modeIdx]
+        return max(0, min(100, (self.freq - lo) * 100 // (hi - lo)))
+
+    def start(self, modeIdx, vol):
+        if self.running:
+            return False
+        self.modeIdx = modeIdx
+        self.count = 0
+        self.freq = self.radio.mode[modeIdx][1]
+        self.done = False
+        self.running = True
+        self.task = uasyncio.create_task(self.run(vol))
+        return True
+
+    def stop(self):
+        'Stop after the seek in progress; nothing is written.'
+        self.running = False
+
+    def add(self, khz, rssi, snr):
+        step = self.radio.khz(self.radio.mode[self.modeIdx][3])
+        last = self.count - 1
+        if last >= 0 and khz - self.khz[last] <= step:
+            if rssi > self.rssi[last]:
+                self.khz[last], self.rssi[last], self.snr[last] = khz, rssi, snr
+            return
+        if self.count < len(self.khz):
+            self.khz[self.count], self.rssi[self.count], self.snr[self.count] = khz, rssi, snr
+            self.count += 1
+
+    def onSeek(self, freq):
+        self.freq = self.radio.khz(freq)
+        if self.progress_cb:
+            self.progress_cb(self)
+
+    async def run(self, vol):
+        radio = self.radio
+        try:
+            await radio.aborrow(self.freq, vol)
+            while self.running:
+                resp = await radio.submit('ats', radio.aseekStation, self.onSeek).wait()
+                self.freq = radio.khz(resp[2] * 256 + resp[3])
+                if resp[1] & 0x01:          # VALID
+                    self.add(self.freq, resp[4], resp[5])
+                if resp[1] & 0x80 or self.count >= len(self.khz):   # BLTF: band top reached
+                    self.done = True
+                    break
+            if self.done:
+                self.save()
+        finally:
+            self.running = False
+            radio.giveBack(vol)
+            if self.progress_cb:
+                self.progress_cb(self)
+
+    def save(self):
+        '''
+        Replace the section of this band in *area*.txt by the stations found, keeping the
+        sections of the other bands. A section is a heading 'ATS <band>' and its stations.
+        '''
+        heading = 'ATS ' + self.radio.mode[self.modeIdx][0]
+        src = self.area + '.txt'
+        tmp = src + '.tmp'
+        with open(tmp, 'w') as out:
+            try:
+                with open(src, 'r') as f:
+                    keep = True
+                    while True:
+                        name = f.readline()
+                        if not name:
+                            break
+                        name = name.rstrip('\r\n')
+                        freq = f.readline().rstrip('\r\n')
+                        if freqfmt.parseFreq(freq) < 0:
+                            keep = name != heading
+                        if keep:
+                            out.write(name + '\n' + freq + '\n')
+            except OSError:
+                pass
+            out.write(heading + '\n\n')
+            for i in range(self.count):
+                out.write('{:d}dBuV {:d}dB\n{}\n'.format(self.rssi[i], self.snr[i], freqfmt.freqText(self.khz[i])))
+        try:
+            os.remove(src)
+        except OSError:
+            pass
+        os.rename(tmp, src)
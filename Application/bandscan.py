@@ -0,0 +1,110 @@
+import time
+import array
+import uasyncio
+
+class ScanResult(object):
+    '''
+    RSSI and SNR of every channel of one band, in buffers allocated when the scan starts.
+    *pos* is the next channel to measure; *stamp* the time.time() of the last measurement.
+    '''
+    def __init__(self, modeIdx, mode):
+        self.modeIdx = modeIdx
+        name, lo, hi, step = mode
+        self.name = name
+        self.fm = modeIdx == 0
+        self.first = lo // 10 if self.fm else lo     # chip units: 10kHz in FM, kHz otherwise
+        self.step = step
+        n = (hi - lo) // (step * 10 if self.fm else step) + 1
+        self.rssi = array.array('B', bytes(n))
+        self.snr = array.array('B', bytes(n))
+        self.pos = 0
+        self.stamp = 0
+
+    def __len__(self):
+        return len(self.rssi)
+
+    def complete(self):
+        return self.pos >= len(self.rssi)
+
+    def freqAt(self, i):
+        return self.first + i * self.step
+
+    def khzAt(self, i):
+        return self.freqAt(i) * 10 if self.fm else self.freqAt(i)
+
+    def point(self, i, points):
+        'Chart point of *points* that shows channel *i*.'
+        return i * points // len(self.rssi)
+
+    def bucket(self, p, points):
+        'Channels shown by chart point *p*: range start and end, empty if the band is short.'
+        n = len(self.rssi)
+        return (p * n + points - 1) // points, ((p + 1) * n + points - 1) // points
+
+    def peak(self, p, points):
+        'Index of the strongest measured channel of chart point *p*, -1 if none is measured yet.'
+        lo, hi = self.bucket(p, points)
+        best = -1
+        for i in range(lo, min(hi, self.pos)):
+            if best < 0 or self.rssi[i] > self.rssi[best]:
+                best = i
+        return best
+
+class BandScan(object):
+    '''
+    Sweeps a band of the Si4735.mode table with fast tunes through a Si4735Async radio. The scan
+    is a uasyncio task that queues one channel at a time, so the UI keeps running in between.
+    Results are kept per band; starting a band again continues an unfinished scan.
+    *progress_cb(result)* is called after every channel and once when the scan ends.
+    '''
+    def __init__(self, radio, progress_cb=None):
+        self.radio = radio
+        self.progress_cb = progress_cb
+        self.results = {}
+        self.current = None             # result being scanned
+        self.running = False
+        self.task = None
+
+    def result(self, modeIdx):
+        return self.results.get(modeIdx)
+
+    def start(self, modeIdx, vol):
+        if self.running:
+            return None
+        res = self.results.get(modeIdx)
+        if res is None or res.complete():
+            res = ScanResult(modeIdx, self.radio.mode[modeIdx])
+            self.results[modeIdx] = res
+        self.current = res
+        self.running = True
+        self.task = uasyncio.create_task(self.run(res, vol))
+        return res
+
+    def shed(self, keep=-1):
+        'Forget the results of all bands but mode *keep* and the one being scanned; True if any.'
+        drop = [m for m in self.results if m != keep and not (self.running and self.results[m] is self.current)]
+        for m in drop:
+            del self.results[m]
+        return len(drop) > 0
+
+    def stop(self):
+        'Stop after the channel being measured; the result can be resumed with start().'
+        self.running = False
+
+    async def run(self, res, vol):
+        radio = self.radio
+        try:
+            await radio.aborrow(res.khzAt(min(res.pos, len(res) - 1)), vol)
+            while self.running and not res.complete():
+                rssi, snr = await radio.submit('scan', radio.ascanChannel, res.freqAt(res.pos)).wait()
+                res.rssi[res.pos] = rssi
+                res.snr[res.pos] = snr
+                res.pos += 1
+                res.stamp = time.time()
+                if self.progress_cb:
+                    self.progress_cb(res)
+        finally:
+            self.running = False
+            radio.giveBack(vol)
+            if self.progress_cb:
+                self.progress_cb(res)
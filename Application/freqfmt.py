@@ -0,0 +1,87 @@
+from micropython import const
+
+MHZ_FROM_KHZ = const(30000)     # frequencies from here on are shown in MHz
+CACHE_MAX = const(32)
+
+_buf = bytearray(16)
+_cache = {}
+
+def _putInt(n, pos):
+    'Write the decimal digits of *n* >= 0 to _buf at *pos*; returns the position after them.'
+    start = pos
+    while True:
+        _buf[pos] = 0x30 + n % 10
+        n //= 10
+        pos += 1
+        if n == 0:
+            break
+    i = start
+    j = pos - 1
+    while i < j:
+        _buf[i], _buf[j] = _buf[j], _buf[i]
+        i += 1
+        j -= 1
+    return pos
+
+def _putUnit(pos, prefix):
+    _buf[pos] = prefix
+    _buf[pos + 1] = 0x48    # 'H'
+    _buf[pos + 2] = 0x7A    # 'z'
+    return pos + 3
+
+def freqText(khz):
+    '''
+    '84.8MHz' / '88.15MHz' from 30MHz up, '1197kHz' below, formatted with integer math into a
+    reused buffer. Results are cached, so asking again for a shown frequency allocates nothing.
+    '''
+    text = _cache.get(khz)
+    if text is not None:
+        return text
+    if khz < MHZ_FROM_KHZ:
+        pos = _putUnit(_putInt(khz, 0), 0x6B)      # 'k'
+    else:
+        pos = _putInt(khz // 1000, 0)
+        frac = khz % 1000
+        _buf[pos] = 0x2E                            # '.'
+        _buf[pos + 1] = 0x30 + frac // 100
+        pos += 2
+        if frac % 100:
+            _buf[pos] = 0x30 + frac // 10 % 10
+            pos += 1
+            if frac % 10:
+                _buf[pos] = 0x30 + frac % 10
+                pos += 1
+        pos = _putUnit(pos, 0x4D)                   # 'M'
+    text = str(memoryview(_buf)[:pos], 'ascii')
+    if len(_cache) >= CACHE_MAX:
+        _cache.clear()
+    _cache[khz] = text
+    return text
+
+def parseFreq(text):
+    "kHz of '84.8MHz', '88.15MHz' or '1197kHz' with integer math, -1 if *text* is not one."
+    n = len(text) - 3
+    if n < 1 or text[n + 1] != 'H' or text[n + 2] != 'z':
+        return -1
+    unit = text[n]
+    if unit == 'M':
+        scale = 1000
+    elif unit == 'k':
+        scale = 1
+    else:
+        return -1
+    khz = 0
+    dot = False
+    for i in range(n):
+        c = ord(text[i]) - 0x30
+        if 0 <= c <= 9:
+            if not dot:
+                khz = khz * 10 + c
+            elif scale > 1:             # digits finer than 1kHz are dropped
+                scale //= 10
+                khz = khz * 10 + c
+        elif c == -2 and not dot:       # '.'
+            dot = True
+        else:
+            return -1
+    return khz * scale
@@ -33,6 +33,7 @@
 import lvgl as lv
 import micropython
 import usys
+import time
 
 # Try standard machine.Timer, or custom timer from lv_timer, if available
 
@@ -63,13 +64,40 @@ try:
 except:
     uasyncio_available = False
 
+# Optional frame time statistics (perf.py of the radio application)
+
+try:
+    import perf
+    perf_frame = perf.hist('frame')
+except ImportError:
+    perf_frame = None
+
+# lv.task_handler() returns this when no LVGL timer is pending
+
+NO_TIMER_READY = 0xFFFFFFFF
+
 ##############################################################################
 
 class event_loop():
+    '''
+    Runs lv.task_handler() adaptively: as soon as the next LVGL timer is due, and at least
+    at *freq* Hz, while there was input in the last *idle_after_ms*; otherwise at *idle_freq*
+    Hz, so an idle screen costs little CPU (the first touch after idling is noticed within
+    1/*idle_freq* s). Running animations do not count: a circular label scroll never
+    ends, and simply moves slower while idle. wake() counts as input, for screens that
+    change without being touched.
+
+    Counters: *frames* task_handler runs, *frame_us* their average and *frame_max_us* the
+    longest duration, *overruns* runs longer than the delay that followed, *skipped* refreshes
+    dropped because the previous one was still pending, *errors* exceptions.
+    The default exception sink prints the exception and stops the loop only after
+    *max_errors* consecutive ones.
+    '''
 
     _current_instance = None
 
-    def __init__(self, freq=25, timer_id=default_timer_id, max_scheduled=2, refresh_cb=None, asynchronous=False, exception_sink=None):
+    def __init__(self, freq=25, timer_id=default_timer_id, max_scheduled=2, refresh_cb=None, asynchronous=False, exception_sink=None,
+                 idle_freq=4, idle_after_ms=3000, max_errors=10):
         if self.is_running():
             raise RuntimeError("Event loop is already running!")
 
@@ -79,8 +107,23 @@ class event_loop():
         event_loop._current_instance = self
 
         self.delay = 1000 // freq
+        self.idle_delay = 1000 // idle_freq
+        self.idle_after_ms = idle_after_ms
+        self.wait = self.delay      # until the next task_handler run, set after each run
+        self.elapsed = 0
+        self.last_tick = time.ticks_ms()
+        self.woken = time.ticks_add(time.ticks_ms(), -idle_after_ms)
+        self.disp = None
         self.refresh_cb = refresh_cb
         self.exception_sink = exception_sink if exception_sink else self.default_exception_sink
+        self.max_errors = max_errors
+        self.errors = 0
+        self.error_run = 0
+        self.frames = 0
+        self.frame_us = 0
+        self.frame_max_us = 0
+        self.overruns = 0
+        self.skipped = 0
 
         self.asynchronous = asynchronous
         if self.asynchronous:
@@ -118,46 +161,109 @@ class event_loop():
     def current_instance():
         return event_loop._current_instance
 
+    def wake(self):
+        'Run at full rate for the next idle_after_ms, starting now.'
+        self.woken = time.ticks_ms()
+        if self.asynchronous:
+            self.refresh_event.set()
+        else:
+            self.wait = 0
+
+    def is_active(self):
+        'Input or wake() during the last idle_after_ms.'
+        if time.ticks_diff(time.ticks_ms(), self.woken) < self.idle_after_ms:
+            return True
+        if self.disp is None:
+            self.disp = lv.disp_get_default()
+            if self.disp is None:
+                return True
+        return self.disp.get_inactive_time() < self.idle_after_ms
+
+    def error(self, e):
+        self.errors += 1
+        self.error_run += 1
+        if self.exception_sink:
+            self.exception_sink(e)
+
+    def refresh(self):
+        'run_handler() and refresh_cb; a frame without an exception ends an error run.'
+        errors = self.errors
+        self.run_handler()
+        if self.refresh_cb:
+            try:
+                self.refresh_cb()
+            except Exception as e:
+                self.error(e)
+        if self.errors == errors:
+            self.error_run = 0
+
+    def run_handler(self):
+        'One lv.task_handler() run; sets the delay until the next one.'
+        t0 = time.ticks_us()
+        try:
+            due = lv.task_handler()
+        except Exception as e:
+            due = self.delay
+            self.error(e)
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        if due is None or due == NO_TIMER_READY:
+            due = self.idle_delay
+        self.wait = min(max(due, 1), self.delay) if self.is_active() else self.idle_delay
+        self.frames += 1
+        self.frame_us += (dt - self.frame_us) >> 3
+        if dt > self.frame_max_us:
+            self.frame_max_us = dt
+        if dt > self.wait * 1000:
+            self.overruns += 1
+        if perf_frame:
+            perf_frame.add(dt)
+
     def task_handler(self, _):
         try:
             if lv._nesting.value == 0:
-                lv.task_handler()
-                if self.refresh_cb: self.refresh_cb()
-            self.scheduled -= 1
+                self.refresh()
         except Exception as e:
-            if self.exception_sink:
-                self.exception_sink(e)
+            self.error(e)
+        self.scheduled -= 1
 
     def timer_cb(self, t):
         # Can be called in Interrupt context
         # Use task_handler_ref since passing self.task_handler would cause allocation.
         lv.tick_inc(self.delay)
+        self.elapsed += self.delay
+        if self.elapsed < self.wait:
+            return
         if self.scheduled < self.max_scheduled:
             try:
                 micropython.schedule(self.task_handler_ref, 0)
                 self.scheduled += 1
+                self.elapsed = 0
             except:
-                pass
+                self.skipped += 1
+        else:
+            self.skipped += 1
 
     async def async_refresh(self):
         while True:
             await self.refresh_event.wait()
             if lv._nesting.value == 0:
                 self.refresh_event.clear()
+                now = time.ticks_ms()
+                lv.tick_inc(time.ticks_diff(now, self.last_tick))
+                self.last_tick = now
                 try:
-                    lv.task_handler()
+                    self.refresh()
                 except Exception as e:
-                    if self.exception_sink:
-                        self.exception_sink(e)
-                if self.refresh_cb: self.refresh_cb()
+                    self.error(e)      # the task must outlive a bad frame, like the timer path
 
     async def async_timer(self):
         while True:
-            await uasyncio.sleep_ms(self.delay)
-            lv.tick_inc(self.delay)
+            await uasyncio.sleep_ms(self.wait)
+            if self.refresh_event.is_set():
+                self.skipped += 1
             self.refresh_event.set()
-            
 
     def default_exception_sink(self, e):
         usys.print_exception(e)
-        event_loop.current_instance().deinit()
+        if self.error_run >= self.max_errors:
+            event_loop.current_instance().deinit()
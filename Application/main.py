@@ -2,29 +2,32 @@ import machine
 import rp2_dma
 import sys
 import time
-import json
+import gc
+import array
+from micropython import const
+import uasyncio
 import lvgl as lv
+import lv_utils
 import MSP2807_ILI9341
 import MSP2807_XPT2046
+import Si4735
+import Si4735_async
+import smeter
+import settings
+import stationindex
+import bandscan
+import ats
+import rds
+import touchcal
+import perf
+import memmgr
+import freqfmt
 
 mutesp = machine.Pin(26, machine.Pin.OUT)
 mutehp = machine.Pin(27, machine.Pin.OUT)
 mutesp.value(1)
 mutehp.value(1)
 
-def printBytes(bs):
-    for i in range(len(bs)):
-        printHex(bs[i])
-    print()
-
-def printHex(h):
-    tbl = "0123456789ABCDEF"
-    r = h % 16
-    x = int(h / 16)
-    print(tbl[x], end="")
-    print(tbl[r], end="")
-    print(" ", end="")
-
 # Generate 48k I2S clock
 # uncomment I2S OUTPUT
 # @rp2.asm_pio(
@@ -65,199 +68,6 @@ sm1 = rp2.StateMachine(
 )
 sm1.active(1)
 
-class Si4735(object):
-    mode = [
-        ['FM',  76000,108000, 10],
-        ['AM',    531,  1602,  9],
-        ['LW',    153,   279,  9],
-        ['120m', 2300,  2495,  5],
-        ['90m',  3200,  3400,  5],
-        ['75m',  3900,  4000,  5],
-        ['60m',  4750,  5060,  5],
-        ['49m',  5730,  6295,  5],
-        ['41m',  7100,  7600,  5],
-        ['31m',  9250,  9900,  5],
-        ['25m', 11600, 12100,  5],
-        ['22m', 13570, 13870,  5],
-        ['19m', 15030, 15800,  5],
-        ['16m', 17480, 17900,  5],
-        ['15m', 18900, 19020,  5],
-        ['13m', 21450, 21750,  5],
-        ['11m', 25670, 26100,  5],
-        ['SW',   2300, 26100,  5]
-    ]
-
-    def __init__(self, i2c, reset = 22):
-        self.addr=0x63
-        self.i2c=i2c
-        self.reset = machine.Pin(reset, machine.Pin.OUT)
-        self.hard_reset()
-        self.modeIdx = -1
-
-    def getModeIdx(self, khz):
-        for i in range(len(self.mode)):
-            if khz >= self.mode[i][1] and khz <= self.mode[i][2]:
-                return i
-        return -1
-
-    def hard_reset(self):
-        if self.reset:
-            for val in (1, 0, 1):
-                self.reset.value(val)
-                time.sleep(0.1)
-            time.sleep(0.1)
-
-    def setProperty(self, buf=None):
-        self.buf = bytes([0x12, 0x00]) + buf
-        self.i2c.writeto(self.addr, self.buf)
-        self.waitCTS()
-        
-    def getProperty(self, buf=None):
-        self.i2c.writeto(self.addr, bytes([0x13, 0x00]) + buf)
-        self.waitCTS()
-        self.resp = self.i2c.readfrom(self.addr, 4)
-        print("getProperty: ",end="")
-        printBytes(self.resp)
-
-    def FMPOWER_UP(self):
-        self.i2c.writeto(self.addr, bytes([0x01, 0x00, 0x05]))  # analog Out
-#         self.i2c.writeto(self.addr, bytes([0x01, 0x00, 0xB0]))   # I2S
-        self.waitCTS()
-        time.sleep(0.5)
-        self.setProperty(bytes([0xFF, 0x00, 0x00, 0x00]))          # Turn off Debug Mode
-#         self.setProperty(bytes([0x01, 0x04, 0xBB, 0x80]))        # I2s sample rate
-
-    def FM_SEEK_BAND_BOTTOM(self, freq):
-        self.setProperty(bytes([0x14, 0x00]) + freq.to_bytes(2, 'big'))
-
-    def FM_SEEK_BAND_TOP(self, freq):
-        self.setProperty(bytes([0x14, 0x01]) + freq.to_bytes(2, 'big'))
-
-    def FM_SEEK_FREQ_SPACING(self, step):
-        self.setProperty(bytes([0x14, 0x02, 0x00]) + step.to_bytes(1, 'big')) # 5(50kHz), 10(100kHz), 20(200kHz)
-
-    def AMPOWER_UP(self):
-        self.i2c.writeto(self.addr, bytes([0x01, 0x01, 0x05])) # analog out
-#         self.i2c.writeto(self.addr, bytes([0x01, 0x01, 0xB0]))  # I2S
-        self.waitCTS()
-        time.sleep(0.5)
-        self.setProperty(bytes([0xFF, 0x00, 0x00, 0x00]))         # Turn off Debug Mode
-#         self.setProperty(bytes([0x01, 0x04, 0xBB, 0x80]))       # I2S sample rate
-
-    def AM_SEEK_BAND_BOTTOM(self, freq):
-        self.setProperty(bytes([0x34, 0x00]) + freq.to_bytes(2, 'big'))
-
-    def AM_SEEK_BAND_TOP(self, freq):
-        self.setProperty(bytes([0x34, 0x01]) + freq.to_bytes(2, 'big'))
-
-    def AM_SEEK_FREQ_SPACING(self, step):
-        self.setProperty(bytes([0x34, 0x02, 0x00]) + step.to_bytes(1, 'big')) # 1 (1kHz), 5 (5kHz), 9 (9kHz), and 10 (10kHz).
-
-    def POWER_DOWN(self):
-        self.i2c.writeto(self.addr, bytes([0x11]))
-        self.waitCTS()
-        time.sleep(1)
-    
-    def setFMDeEmphasis(self):
-        self.setProperty(bytes([0x11, 0x00, 0x00, 0x01]))  # 01 = 50 μs. Used in Europe, Australia, Japan
-
-    def FM_TUNE_FREQ(self, freq, fast=None):
-        self.freq=freq
-        self.fast=fast
-        param = bytes([0x20, 0x00]) if fast == None else bytes([0x20, 0x01])
-        self.i2c.writeto(self.addr, param + freq.to_bytes(2, 'big'))
-        self.waitCTS()
-
-    def AM_TUNE_FREQ(self, freq, fast=None):
-        self.freq=freq
-        self.fast=fast
-        param = bytes([0x40, 0x00]) if fast == None else bytes([0x40, 0x01])
-        self.i2c.writeto(self.addr, param + freq.to_bytes(2, 'big'))
-        self.waitCTS()
-
-    def FM_SEEK_START(self, seekDir):
-        arg1 = 0b00001100 if seekDir == 1 else 0b00000100
-        self.i2c.writeto(self.addr, bytes([0x21, arg1]))
-        self.waitCTS()
-
-    def AM_SEEK_START(self, seekDir):
-        arg1 = 0b00001100 if seekDir == 1 else 0b00000100
-        self.i2c.writeto(self.addr, bytes([0x41, arg1]))
-        self.waitCTS()
-
-    def FM_TUNE_STATUS(self):
-        self.i2c.writeto(self.addr, bytes([0x22, 0x00]))
-        self.waitCTS()
-        resp = self.i2c.readfrom(self.addr, 7)
-        self.freq = resp[2] * 256
-        self.freq = self.freq + resp[3]
-        self.rssi = resp[4]
-        self.snr  = resp[5]
-        self.valid = resp[1] & 0b0000_0001
-
-    def AM_TUNE_STATUS(self):
-        self.i2c.writeto(self.addr, bytes([0x42, 0x00]))
-        self.waitCTS()
-        resp = self.i2c.readfrom(self.addr, 7)
-        self.freq = resp[2] * 256
-        self.freq = self.freq + resp[3]
-        self.rssi = resp[4]
-        self.snr  = resp[5]
-        self.valid = resp[1] & 0b0000_0001
-
-    def FM_RSQ_STATUS(self):
-        self.i2c.writeto(self.addr, bytes([0x23, 0x00]))
-        self.waitCTS()
-        resp = self.i2c.readfrom(self.addr, 7)
-        self.rssi = resp[4]
-        self.snr  = resp[5]
-        self.stblend = resp[3] & 0x7f
-        self.valid = resp[2] & 0b0000_0001
-
-    def AM_RSQ_STATUS(self):
-        self.i2c.writeto(self.addr, bytes([0x43, 0x00]))
-        self.waitCTS()
-        resp = self.i2c.readfrom(self.addr, 7)
-        self.rssi = resp[4]
-        self.snr  = resp[5]
-        self.stblend = resp[3] & 0x7f
-        self.valid = resp[2] & 0b0000_0001
-
-    def setVolume(self, vol):
-        self.vol = vol
-        if self.vol > 63:
-            self.vol = 63
-        self.setProperty(bytes([0x40, 0x00]) + self.vol.to_bytes(2, 'big'))
-
-    def unmute(self):
-        self.setProperty(bytes([0x40, 0x01, 0x00, 0x00]))
-
-    def mute(self):
-        self.setProperty(bytes([0x40, 0x01, 0x00, 0x03]))
-
-    def waitCTS(self):
-        while True:
-            cts = self.i2c.readfrom(self.addr, 1)
-            if cts >= b'0x80': break
-
-    def getFmFreqStr(self):
-        f1 = str(self.freq / 100)
-        f1last = len(f1)
-        if f1last > 6:
-            f2 = f1[f1last - 1]
-            f3 = f1.rstrip(f2)
-            f4 = f3.rstrip('0')
-        else:
-            f4 = f1.rstrip('0')
-        if f4[-1] == '.': f4 = f4 + "0"
-        f4 = f4 + "MHz"
-        return f4
-
-    def getAmFreqStr(self):
-        f1 = str(self.freq)
-        f1 = f1 + "kHz"
-        return f1
-
 i2c = machine.I2C(0, scl=machine.Pin(21), sda=machine.Pin(20), freq=50_000)
 spi=machine.SPI(
     1,
@@ -269,12 +79,23 @@ spi=machine.SPI(
     miso=machine.Pin(12,machine.Pin.IN)
 )        
 
-dma0=rp2_dma.DMA(1)
+dma0=rp2_dma.DMA()       # a free channel; with MicroPython 1.21+ its IRQ ends each flush
+
+# LVGL runs as a uasyncio task so that the Si4735 worker can await the chip meanwhile; it
+# refreshes at 25 Hz while the screen is used and at 4 Hz after 3 s without input or wake()
+mem = memmgr.MemMgr()
+mem.setScreen("MAIN")
+
+def memFrame():
+    mem.frame(not event_loop.is_active())
+
+event_loop = lv_utils.event_loop(asynchronous=True, refresh_cb=memFrame)
 
 disp = MSP2807_ILI9341.ILI9341(
     rot=MSP2807_ILI9341.PORTRAIT,
     res=(240,320),
     spi=spi,
+    spi_id=1,
     cs=9,
     dc=8,
     bl=13,
@@ -284,6 +105,7 @@ disp = MSP2807_ILI9341.ILI9341(
     bgr=False,
     rp2_dma=dma0
 )
+disp.clear(0xFFFF)                  # one DMA fill: no power-up garbage before LVGL draws
 disp.set_backlight(100)
 
 spi2 = machine.SoftSPI(
@@ -294,11 +116,14 @@ spi2 = machine.SoftSPI(
     mosi=machine.Pin(18,machine.Pin.OUT),
     miso=machine.Pin(19,machine.Pin.IN)
 )
+# own SoftSPI: never reconfigured; pass penirq=<GPIO> once T_IRQ is wired to skip idle reads
 touch = MSP2807_XPT2046.Xpt2046(spi=spi2,cs=16,rot=MSP2807_XPT2046.PORTRAIT)
 
 tabview = lv.tabview(lv.scr_act(), lv.DIR.BOTTOM, 16)
 tab1 = tabview.add_tab("MAIN")
 tab2 = tabview.add_tab("Station")
+tab3 = tabview.add_tab("Scan")
+TAB_NAMES = ("MAIN", "Station", "Scan", "Diag")
 
 def tab1_event(e):
     if btnStepDown.is_visible():
@@ -416,14 +241,23 @@ class freqStep(object):
             self.cont.add_flag(lv.obj.FLAG.HIDDEN)
 
 
+TITLE = "Si4735 RADIO\nJP3SRS"
 labelTitle = lv.label(tab1)
 labelTitle.set_width(lv.pct(50))
-labelTitle.set_text("Si4735 RADIO\nJP3SRS")
+labelTitle.set_text(TITLE)
 labelTitle.set_style_text_font(lv.font_GenJyuuGothic_Normal_16, 0)
 labelTitle.set_style_text_align( lv.TEXT_ALIGN.RIGHT, lv.PART.MAIN | lv.STATE.DEFAULT )
 #labelTitle.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
 labelTitle.align(lv.ALIGN.TOP_RIGHT, 0, 0)
 
+# RDS RadioText under the title, which shows PS and PTY while RDS is received
+labelRt = lv.label(tab1)
+labelRt.set_width(lv.pct(50))
+labelRt.set_text("")
+labelRt.set_style_text_font(lv.font_montserrat_12, 0)
+labelRt.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
+labelRt.align_to(labelTitle, lv.ALIGN.OUT_BOTTOM_RIGHT, 0, 2)
+
 kbd_map = ["7", "8", "9", "M", "\n",
           "4", "5", "6", "k", "\n",
           "1", "2", "3", "C", "\n",
@@ -444,20 +278,14 @@ def kbd_valueChange(event_struct):
         kbdTextArea.del_char()
         kbdTextArea.del_char()
         if len(saveFreq) > 0: return
-        if radio.modeIdx == 0:
-            radio.FM_SEEK_START(0)
-        elif radio.modeIdx > 0:
-            radio.AM_SEEK_START(0)
+        radio.requestSeek(0)
         timer1.resume()
         return
     if txt == ">>":
         kbdTextArea.del_char()
         kbdTextArea.del_char()
         if len(saveFreq) > 0: return
-        if radio.modeIdx == 0:
-            radio.FM_SEEK_START(1)
-        elif radio.modeIdx >0:
-            radio.AM_SEEK_START(1)
+        radio.requestSeek(1)
         timer1.resume()
         return
     if txt == "C":
@@ -492,38 +320,24 @@ def kbd_valueChange(event_struct):
         radioTune(kbdTextArea.get_text())
         timer1.resume()
 
-def btnStepDown_cb(event):
-    timer1.pause()
-    newFreq = radio.freq - st.getStep()
-    if radio.modeIdx == 0:
-        if (newFreq * 10) >= radio.mode[0][1] and (newFreq * 10) <= radio.mode[0][2]:
-            radio.FM_TUNE_FREQ(newFreq, fast = True)
+def stepTune(step):
+    modeIdx = radio.modeIdx
+    if radio.requestStep(step):
+        if radio.modeIdx == 0:
             kbdTextArea.set_text(radio.getFmFreqStr())
-    else:
-        if newFreq >= 149 and newFreq <= 23000:
-            newMode = radio.getModeIdx(newFreq)
-            if newMode != radio.modeIdx:
-                modeBtnLabel.set_text(radio.mode[newMode][0])
-                radio.modeIdx = newMode
-            radio.AM_TUNE_FREQ(newFreq, fast = True)
+        else:
+            if radio.modeIdx != modeIdx:
+                modeBtnLabel.set_text(radio.mode[radio.modeIdx][0])
             kbdTextArea.set_text(radio.getAmFreqStr())
+
+def btnStepDown_cb(event):
+    timer1.pause()
+    stepTune(-st.getStep())
     timer1.resume()
 
 def btnStepUp_cb(event):
     timer1.pause()
-    newFreq = radio.freq + st.getStep()
-    if radio.modeIdx == 0:
-        if newFreq * 10 >= radio.mode[0][1] and newFreq * 10 <= radio.mode[0][2]:
-            radio.FM_TUNE_FREQ(newFreq, fast = True)
-            kbdTextArea.set_text(radio.getFmFreqStr())
-    else:
-        if newFreq >= 149 and newFreq <= 23000:
-            newMode = radio.getModeIdx(newFreq)
-            if newMode != radio.modeIdx:
-                modeBtnLabel.set_text(radio.mode[newMode][0])
-                radio.modeIdx = newMode
-            radio.AM_TUNE_FREQ(newFreq, fast = True)
-            kbdTextArea.set_text(radio.getAmFreqStr())
+    stepTune(st.getStep())
     timer1.resume()
 
 btnStepDown = lv.btn(tab1)
@@ -572,7 +386,7 @@ def volumeSlider_event_cb(event):
     slider = event.get_target_obj()
     volumeSliderLabel.set_text("Vol {:d}".format(slider.get_value()))
     volumeSliderLabel.align_to(slider, lv.ALIGN.LEFT_MID, -60, 0)
-    radio.setVolume(slider.get_value())
+    radio.requestVolume(slider.get_value())
 
 volumeSlider = lv.slider(tab1)
 volumeSlider.set_width(lv.pct(60))
@@ -637,37 +451,126 @@ labelSTBLEND.set_style_pad_bottom( 2, lv.PART.MAIN | lv.STATE.DEFAULT )
 labelSTBLEND.align_to(modeBtnLabel, lv.ALIGN.BOTTOM_LEFT, 0, 24)
 
 # -- tab2 screen --
+STATION_ROW_H = const(28)
+STATION_POOL = const(10)            # row widgets: visible rows (240 / 28) + partly visible ones
+
 class stationList(object):
+    '''
+    Station list of one [0-9].txt file. Only STATION_POOL row widgets exist; while scrolling
+    they are moved down/up and refilled, station r always in slot r % STATION_POOL. Rows are
+    read on demand from the compiled N.idx (see stationindex), built from N.txt when needed.
+    shed() deletes the widgets and closes the index when the heap runs low; restore() builds
+    them again and reopens the last area.
+    '''
     def __init__(self):
-        self.table = lv.table(tab2)
-        self.table.align(lv.ALIGN.TOP_MID, 0, 36)
-        self.table.set_col_width(0, 130)
-        self.table.set_col_width(1, 80)
-        self.table.set_height(240)
-        self.table.set_style_text_font(lv.font_GenJyuuGothic_Normal_16, 0)
-        self.table.set_style_pad_left(4, lv.PART.ITEMS | lv.STATE.DEFAULT)
-        self.table.set_style_pad_right(4, lv.PART.ITEMS | lv.STATE.DEFAULT)
-        self.table.set_style_pad_top(4, lv.PART.ITEMS|lv.STATE.DEFAULT)
-        self.table.set_style_pad_bottom(4, lv.PART.ITEMS | lv.STATE.DEFAULT)
-
-    def table_event_cb(self,event):
+        self.area = None
+        self.heapPeak = 0
+        self.build()
+
+    def build(self):
+        self.cont = lv.obj(tab2)
+        self.cont.set_size(216, 240)
+        self.cont.align(lv.ALIGN.TOP_MID, 0, 36)
+        self.cont.set_style_pad_all(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+        self.cont.set_style_text_font(lv.font_GenJyuuGothic_Normal_16, 0)
+        # sets the scrollable height to that of all rows
+        self.spacer = lv.obj(self.cont)
+        self.spacer.set_size(1, 0)
+        self.spacer.set_style_bg_opa(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+        self.spacer.set_style_border_width(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+        self.spacer.clear_flag(lv.obj.FLAG.CLICKABLE)
+        self.rows = []
+        for i in range(STATION_POOL):
+            row = lv.obj(self.cont)
+            row.set_size(lv.pct(100), STATION_ROW_H)
+            row.set_style_radius(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+            row.set_style_pad_left(4, lv.PART.MAIN | lv.STATE.DEFAULT)
+            row.set_style_pad_right(4, lv.PART.MAIN | lv.STATE.DEFAULT)
+            row.set_style_pad_top(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+            row.set_style_pad_bottom(0, lv.PART.MAIN | lv.STATE.DEFAULT)
+            row.clear_flag(lv.obj.FLAG.SCROLLABLE)
+            row.add_flag(lv.obj.FLAG.EVENT_BUBBLE)
+            row.add_flag(lv.obj.FLAG.HIDDEN)
+            name = lv.label(row)
+            name.align(lv.ALIGN.LEFT_MID, 0, 0)
+            freq = lv.label(row)
+            freq.align(lv.ALIGN.RIGHT_MID, 0, 0)
+            self.rows.append((row, name, freq))
+        self.slotRow = [-1] * STATION_POOL  # station shown by each slot
+        self.slotKhz = array.array('I', [0] * STATION_POOL)
+        self.index = None
+        self.cont.add_event(self.event_cb, lv.EVENT.SCROLL, None)
+        self.cont.add_event(self.event_cb, lv.EVENT.CLICKED, None)
+
+    def shed(self):
+        'Free the list; True if there was one.'
+        if self.cont is None:
+            return False
+        if self.index:
+            self.index.close()
+            self.index = None
+        self.cont.delete()
+        self.cont = None
+        self.spacer = None
+        self.rows = []
+        return True
+
+    def restore(self):
+        if self.cont is None:
+            self.build()
+            if self.area is not None:
+                self.dispStationat(self.area)
+
+    def event_cb(self, event):
         code = event.get_code()
-        obj = event.get_target_obj()
-        row = lv.C_Pointer()
-        col = lv.C_Pointer()
-        obj.get_selected_cell(row, col)
-        fstr = obj.get_cell_value(row.uint_val, 1)
-        radioTune(fstr)
+        if code == lv.EVENT.SCROLL:
+            self.refresh()
+        elif code == lv.EVENT.CLICKED:
+            obj = event.get_target_obj()
+            if not obj.has_flag(lv.obj.FLAG.EVENT_BUBBLE):
+                return                      # the list itself, not a row
+            slot = obj.get_index() - 1      # child 0 is the spacer
+            khz = self.slotKhz[slot]
+            if khz:
+                tuneKhz(khz, freqfmt.freqText(khz))
+
+    def refresh(self):
+        'Bind the slots to the stations in view; only slots whose station changed are refilled.'
+        first = max(0, self.cont.get_scroll_y() // STATION_ROW_H)
+        count = self.index.count if self.index else 0
+        for r in range(first, first + STATION_POOL):
+            slot = r % STATION_POOL
+            if self.slotRow[slot] == r:
+                continue
+            self.slotRow[slot] = r
+            row, name, freq = self.rows[slot]
+            if r >= count:
+                row.add_flag(lv.obj.FLAG.HIDDEN)
+                continue
+            khz, band, nlen, noff = self.index.record(r)
+            self.slotKhz[slot] = khz
+            name.set_text(self.index.name(nlen, noff))
+            freq.set_text(freqfmt.freqText(khz) if khz else "")
+            row.set_y(r * STATION_ROW_H)
+            row.clear_flag(lv.obj.FLAG.HIDDEN)
+        self.heapPeak = max(self.heapPeak, gc.mem_alloc())
 
     def dispStationat(self, area):
-        self.fname = area + ".txt"
-        with open(self.fname, "r") as f:
-            self.lines = f.read().splitlines()
-        self.table.clean()
-        self.table.set_row_cnt(0)
-        for i in range(len(self.lines)):
-            self.table.set_cell_value(int(i/2), 0, self.lines[i]) if i % 2 == 0 else self.table.set_cell_value(int(i/2), 1, self.lines[i])
-        self.table.add_event(self.table_event_cb, lv.EVENT.VALUE_CHANGED, None)
+        try:
+            index = stationindex.openArea(area, Si4735.bandIndex)
+        except OSError:
+            return                          # e.g. A.txt before the first ATS
+        if self.cont is None:
+            self.build()
+        self.area = area
+        if self.index:
+            self.index.close()
+        self.index = index
+        for i in range(STATION_POOL):
+            self.slotRow[i] = -1
+        self.spacer.set_height(self.index.count * STATION_ROW_H)
+        self.cont.scroll_to_y(0, lv.ANIM.OFF)
+        self.refresh()
 
 stations = stationList()
 st = freqStep()
@@ -681,81 +584,185 @@ def areabtn_cb(event):
     #print("press: " + label.get_text())
     stations.dispStationat(label.get_text())
 
-for i in range(10):
+for i in range(11):
     areabtn = lv.btn(tab2)
     areabtn.set_width(16)
     areabtn.set_height(20)
     areabtn.add_event(areabtn_cb, lv.EVENT.CLICKED, None)
     areabtn.align(lv.ALIGN.TOP_LEFT, 6 + i * 20, 2)
     aliabtnlabel = lv.label(areabtn)
-    aliabtnlabel.set_text(str(i))
+    aliabtnlabel.set_text(str(i) if i < 10 else ats.ATS_AREA)
     aliabtnlabel.align_to(areabtn, lv.ALIGN.CENTER, 0, 0)
 
 
-def radioTune(freq):
-    modeChange = False
-    if len(freq) < 4:
-        return
+# -- tab3 screen --
+SCAN_POINTS = const(100)            # chart points; a point shows the strongest of its channels
+
+scanChart = lv.chart(tab3)
+scanChart.set_size(220, 200)
+scanChart.align(lv.ALIGN.TOP_MID, 0, 36)
+scanChart.set_point_count(SCAN_POINTS)
+scanChart.set_range(lv.chart.AXIS.PRIMARY_Y, 0, 80)
+scanChart.set_div_line_count(5, 0)
+scanChart.set_style_size(0, 0, lv.PART.INDICATOR)
+scanRssi = scanChart.add_series(lv.palette_main(lv.PALETTE.GREEN), lv.chart.AXIS.PRIMARY_Y)
+scanSnr = scanChart.add_series(lv.palette_main(lv.PALETTE.ORANGE), lv.chart.AXIS.PRIMARY_Y)
+scanLastPoint = -1
+
+scanLabel = lv.label(tab3)
+scanLabel.set_text("")
+scanLabel.align_to(scanChart, lv.ALIGN.OUT_BOTTOM_LEFT, 0, 6)
+
+scanBtn = lv.btn(tab3)
+scanBtn.set_size(60, 24)
+scanBtn.align(lv.ALIGN.TOP_RIGHT, -10, 4)
+scanBtnLabel = lv.label(scanBtn)
+scanBtnLabel.set_text("Scan")
+scanBtnLabel.center()
+
+atsBtn = lv.btn(tab3)
+atsBtn.set_size(60, 24)
+atsBtn.align_to(scanBtn, lv.ALIGN.OUT_LEFT_MID, -8, 0)
+atsBtnLabel = lv.label(atsBtn)
+atsBtnLabel.set_text("ATS")
+atsBtnLabel.center()
+
+def scanPoint(res, p):
+    i = res.peak(p, SCAN_POINTS)
+    scanChart.set_value_by_id(scanRssi, p, res.rssi[i] if i >= 0 else lv.CHART_POINT_NONE)
+    scanChart.set_value_by_id(scanSnr, p, res.snr[i] if i >= 0 else lv.CHART_POINT_NONE)
+
+def scanShowLabel(res):
+    if scanner.running:
+        scanLabel.set_text("{} {:d}/{:d}".format(res.name, res.pos, len(res)))
+    elif res.complete():
+        scanLabel.set_text("{} {:d}s ago".format(res.name, time.time() - res.stamp))
     else:
-        fnum = freq[0:len(freq)-3]
-
-    if freq[-3] == "M":
-        fmhz = int(float(fnum) * 1000.0 / 10)
-        fkhz = int(float(fnum) * 1000.0)
-    elif freq[-3] == "k":
-        fmhz = int(float(fnum) * 1.00 / 10)
-        fkhz = int(float(fnum) * 1.00)
+        scanLabel.set_text("{} {:d}/{:d} paused".format(res.name, res.pos, len(res)))
+
+def scanShow(res):
+    'Redraw the chart from the stored result *res* (None: empty chart).'
+    global scanLastPoint
+    scanLastPoint = -1
+    if res is None:
+        scanChart.set_all_value(scanRssi, lv.CHART_POINT_NONE)
+        scanChart.set_all_value(scanSnr, lv.CHART_POINT_NONE)
+        scanLabel.set_text(radio.mode[radio.modeIdx][0])
     else:
+        for p in range(SCAN_POINTS):
+            scanPoint(res, p)
+        scanShowLabel(res)
+    scanChart.refresh()
+
+def scanProgress(res):
+    'BandScan callback: redraw the point of the channel just measured, once the next one starts.'
+    global scanLastPoint
+    p = res.point(res.pos - 1, SCAN_POINTS) if res.pos else 0
+    if p != scanLastPoint or not scanner.running:
+        scanPoint(res, p)
+        scanChart.refresh()
+        scanShowLabel(res)
+        scanLastPoint = p
+        event_loop.wake()
+    if not scanner.running:
+        scanBtnLabel.set_text("Scan")
+
+def scanBtn_cb(event):
+    if scanner.running:
+        scanner.stop()
         return
-    
-    #print("fmhz:" + str(fmhz) + " fkhz: " + str(fkhz) + " freq: " + freq)
+    if autoStore.running:
+        return
+    res = scanner.start(radio.modeIdx, volumeSlider.get_value())
+    scanShow(res)
+    scanBtnLabel.set_text("Stop")
+
+def atsProgress(a):
+    event_loop.wake()
+    band = radio.mode[a.modeIdx][0]
+    if a.running:
+        scanLabel.set_text("{} ATS {:d}% {:d}st".format(band, a.progress(), a.count))
+        return
+    if a.done:
+        scanLabel.set_text("{} ATS {:d}st -> {}.txt".format(band, a.count, a.area))
+    else:
+        scanLabel.set_text("{} ATS stopped".format(band))
+    atsBtnLabel.set_text("ATS")
+
+def atsBtn_cb(event):
+    'Seek through the band and store the stations found as Station tab area A.'
+    if autoStore.running:
+        autoStore.stop()
+        return
+    if scanner.running:
+        return
+    autoStore.start(radio.modeIdx, volumeSlider.get_value())
+    atsBtnLabel.set_text("Stop")
+
+def scanChart_cb(event):
+    'Tune to the strongest channel of the tapped point.'
+    res = scanner.result(radio.modeIdx)
+    p = scanChart.get_pressed_point()
+    if scanner.running or res is None or p == lv.CHART_POINT_NONE:
+        return
+    i = res.peak(p, SCAN_POINTS)
+    if i >= 0:
+        tuneKhz(res.khzAt(i), freqfmt.freqText(res.khzAt(i)))
+
+def tabview_cb(event):
+    tab = tabview.get_tab_act()
+    mem.setScreen(TAB_NAMES[tab])
+    if tab == 1:
+        stations.restore()
+    if tab == 2 and not scanner.running:
+        scanShow(scanner.result(radio.modeIdx))
+
+scanBtn.add_event(scanBtn_cb, lv.EVENT.CLICKED, None)
+atsBtn.add_event(atsBtn_cb, lv.EVENT.CLICKED, None)
+scanChart.add_event(scanChart_cb, lv.EVENT.VALUE_CHANGED, None)
+tabview.add_event(tabview_cb, lv.EVENT.VALUE_CHANGED, None)
+
+# Hidden diagnostics tab: a long press on the Scan tab adds it. It shows the perf statistics,
+# refreshed once a second while it is open; perf.dump() prints the same over the REPL.
+DIAG_TAB = const(3)
+diagTab = None
+diagLabel = None
+
+def diagShow(timer):
+    if diagTab is not None and tabview.get_tab_act() == DIAG_TAB:
+        diagLabel.set_text(perf.text() + "\nloop {:d} skip {:d} over {:d} err {:d}\n".format(
+            event_loop.frames, event_loop.skipped, event_loop.overruns, event_loop.errors) + mem.text())
+
+def diagOpen_cb(event):
+    global diagTab, diagLabel
+    if diagTab is None:
+        diagTab = tabview.add_tab("Diag")
+        diagLabel = lv.label(diagTab)
+        diagLabel.set_width(lv.pct(100))
+        diagLabel.set_style_text_font(lv.font_montserrat_12, 0)
+        lv.timer_create(diagShow, 1000, None)
+    tabview.set_act(DIAG_TAB, lv.ANIM.OFF)
+    mem.setScreen(TAB_NAMES[DIAG_TAB])
+    diagShow(None)
+
+tab3.add_event(diagOpen_cb, lv.EVENT.LONG_PRESSED, None)
+
 
+def radioTune(freq):
+    fkhz = freqfmt.parseFreq(freq)
+    if fkhz < 0:
+        return
+    tuneKhz(fkhz, freq)
+
+def tuneKhz(fkhz, freq):
     newMode = radio.getModeIdx(fkhz)
+    radio.requestTune(fkhz, volumeSlider.get_value())
     if newMode == 0:                 # Frequency in FM Mode
-        if radio.modeIdx != 0:       # Change from AM to FM Mode
-            mutesp.value(1)
-            mutehp.value(1)
-            radio.POWER_DOWN()
-            radio.FMPOWER_UP()
-            modeChange = True
-        radio.mute()
-        radio.modeIdx = newMode
-        radio.setFMDeEmphasis()
-        radio.FM_SEEK_BAND_BOTTOM(int(radio.mode[newMode][1] / 10))
-        radio.FM_SEEK_BAND_TOP(int(radio.mode[newMode][2] / 10))
-        radio.FM_SEEK_FREQ_SPACING(radio.mode[newMode][3])
-        radio.FM_TUNE_FREQ(fmhz)
-        radio.setVolume(volumeSlider.get_value())
-        radio.unmute()
-        if modeChange == True:
-            time.sleep(1)
-            mutehp.value(0)
-            time.sleep(0.6)
-            mutesp.value(0)
         kbdTextArea.set_text(freq)
         modeBtnLabel.set_text(radio.mode[newMode][0])
         st.changeFM()
         st.changebg(5)
     elif newMode > 0: # Frequency in AM Mode
-        if radio.modeIdx == 0 or radio.modeIdx == -1:       # switch from FM to AM mode
-            mutesp.value(1)
-            mutehp.value(1)
-            radio.POWER_DOWN()
-            radio.AMPOWER_UP()
-            modeChange = True
-        radio.mute()
-        radio.modeIdx = newMode
-        radio.AM_SEEK_BAND_BOTTOM(int(radio.mode[newMode][1]))
-        radio.AM_SEEK_BAND_TOP(int(radio.mode[newMode][2]))
-        radio.AM_SEEK_FREQ_SPACING(radio.mode[newMode][3])
-        radio.AM_TUNE_FREQ(fkhz)
-        radio.setVolume(volumeSlider.get_value())
-        radio.unmute()
-        if modeChange == True:
-            time.sleep(1)
-            mutehp.value(0)
-            time.sleep(0.6)
-            mutesp.value(0)
         kbdTextArea.set_text(freq)
         modeBtnLabel.set_text(radio.mode[newMode][0])
         st.changeAM()
@@ -764,73 +771,102 @@ def radioTune(freq):
         else:
             st.changebg(1)
     
-radio = Si4735(i2c, 22)
-configFileName = "config.json"
-with open(configFileName, 'r') as f: config = json.load(f)
+# GPO2/INT is not wired on this board; pass irq=<GPIO> to wait on the INT line instead of polling
+radio = Si4735_async.Si4735Async(i2c, 22, mutesp, mutehp)
+scanner = bandscan.BandScan(radio, scanProgress)
+autoStore = ats.Ats(radio, atsProgress)
+
+# caches dropped when the heap runs low, cheapest to rebuild first
+mem.addShedder(lambda: scanner.shed(radio.modeIdx))
+mem.addShedder(lambda: tabview.get_tab_act() != 1 and stations.shed())
+config = settings.Settings()
+cal = touchcal.parseCal(config["TouchCal"])
+if cal:
+    touch.set_cal(cal)
+
+def touchCalDone(cal):
+    config.set("TouchCal", touchcal.calText(cal))
+    config.flush(True)
+
+# touching the screen while powering up starts the three point touch calibration
+if touch.pressed():
+    while touch.pressed():          # the first target must not get this touch
+        time.sleep_ms(20)
+    touchCalibration = touchcal.TouchCal(touch, touchCalDone)
 radioTune(config["Freq"])
+# radioTune selects the default step of the band; bring back the stored ones
+st.lastFmIdx = config["FmStep"]
+st.lastAmIdx = config["AmStep"]
+st.changebg(st.lastFmIdx if st.mode == 0 else st.lastAmIdx)
 
-radio.setVolume(config["Vol"])
+radio.requestVolume(config["Vol"])
 volumeSlider.set_value(config["Vol"], lv.ANIM.OFF)
 volumeSliderLabel.set_text("Vol {:d}".format(config["Vol"]))
 
+meter = smeter.SMeter()
+rdsDecoder = rds.Decoder()
+shownMode = -1
+shownPeriod = Si4735.STATUS_SLOW_MS
+statusReq = None
 def updateScreen(timer1):
+    global shownPeriod, statusReq
+    if radio.statusPeriod() != shownPeriod:
+        shownPeriod = radio.statusPeriod()
+        timer1.set_period(shownPeriod)
+    if shownPeriod != Si4735.STATUS_SLOW_MS:
+        event_loop.wake()               # seeking or step tuning: keep the display at full rate
+    req = radio.requestStatus()
+    if req is not statusReq:            # a status read still queued takes this tick along
+        statusReq = req
+        uasyncio.create_task(showStatus(req))
+    config.set("Vol", volumeSlider.get_value())
+    if len(kbdTextArea.get_text()) > 3:
+        config.set("Freq", kbdTextArea.get_text())
+    config.set("FmStep", st.lastFmIdx)
+    config.set("AmStep", st.lastAmIdx)
+    config.flush()
+    radio.requestFinishFastTune()
+
+async def showStatus(req):
+    'Redraw the fields the status read *req* changed, as soon as the worker has done it.'
+    global shownMode
+    try:
+        await req.wait()
+    except Exception:
+        pass                            # printed by the worker; RDS and the S-meter still move
+    dirty = radio.takeDirty()
+    if radio.modeIdx != shownMode:
+        shownMode = radio.modeIdx
+        dirty = Si4735.DIRTY_ALL
+        meter.reset()
+    if dirty & Si4735.DIRTY_FREQ:
+        if kbdTextArea.get_text() != radio.getFreqStr():
+            kbdTextArea.set_text(radio.getFreqStr())
+        rdsDecoder.reset()
+        radio.rds.clear()
     if radio.modeIdx == 0:
-        radio.FM_TUNE_STATUS()
-        radio.FM_RSQ_STATUS()
-        if kbdTextArea.get_text() != radio.getFmFreqStr():
-            kbdTextArea.set_text(radio.getFmFreqStr())
-    else:
-        radio.AM_TUNE_STATUS()
-        radio.AM_RSQ_STATUS()
-        if kbdTextArea.get_text() != radio.getAmFreqStr():
-            kbdTextArea.set_text(radio.getAmFreqStr())
-
-    labelSignal.set_text(str(radio.rssi) + "dBuV")
-    if radio.modeIdx > 0:
-        if radio.rssi >= 0 and radio.rssi <=  1: smeterBar.set_value(0, lv.ANIM.OFF)   # S0
-        elif radio.rssi >  1 and radio.rssi <=  1: smeterBar.set_value(10, lv.ANIM.OFF)  # S1
-        elif radio.rssi >  2 and radio.rssi <=  3: smeterBar.set_value(20, lv.ANIM.OFF)  # S2
-        elif radio.rssi >  3 and radio.rssi <=  4: smeterBar.set_value(30, lv.ANIM.OFF)  # S3
-        elif radio.rssi >  4 and radio.rssi <= 10: smeterBar.set_value(40, lv.ANIM.OFF)  # S4
-        elif radio.rssi > 10 and radio.rssi <= 16: smeterBar.set_value(50, lv.ANIM.OFF)  # S5
-        elif radio.rssi > 16 and radio.rssi <= 22: smeterBar.set_value(60, lv.ANIM.OFF)  # S6
-        elif radio.rssi > 22 and radio.rssi <= 28: smeterBar.set_value(70, lv.ANIM.OFF)  # S7
-        elif radio.rssi > 28 and radio.rssi <= 34: smeterBar.set_value(80, lv.ANIM.OFF)  # S8
-        elif radio.rssi > 34 and radio.rssi <= 44: smeterBar.set_value(90, lv.ANIM.OFF)  # S9
-        elif radio.rssi > 44 and radio.rssi <= 54: smeterBar.set_value(100, lv.ANIM.OFF)  # S9 +10
-        elif radio.rssi > 54 and radio.rssi <= 64: smeterBar.set_value(110, lv.ANIM.OFF)  # S9 +20
-        elif radio.rssi > 64 and radio.rssi <= 74: smeterBar.set_value(120, lv.ANIM.OFF)  # S9 +30
-        elif radio.rssi > 74 and radio.rssi <= 84: smeterBar.set_value(130, lv.ANIM.OFF)  # S9 +40
-        elif radio.rssi > 84 and radio.rssi <= 94: smeterBar.set_value(140, lv.ANIM.OFF)  # S9 +50
-        elif radio.rssi > 94:                      smeterBar.set_value(150, lv.ANIM.OFF)  # S9 +60
-        elif radio.rssi > 95:                      smeterBar.set_value(160, lv.ANIM.OFF)  #>S9 +60
-    if radio.modeIdx == 0:
-        if radio.rssi >= 0 and radio.rssi <=  1: smeterBar.set_value(50, lv.ANIM.OFF)   # S0
-        elif radio.rssi >  1 and radio.rssi <=  2: smeterBar.set_value(60, lv.ANIM.OFF)  # S1
-        elif radio.rssi >  2 and radio.rssi <=  8: smeterBar.set_value(70, lv.ANIM.OFF)  # S2
-        elif radio.rssi >  8 and radio.rssi <= 14: smeterBar.set_value(80, lv.ANIM.OFF)  # S3
-        elif radio.rssi > 14 and radio.rssi <= 24: smeterBar.set_value(90, lv.ANIM.OFF)  # S4
-        elif radio.rssi > 24 and radio.rssi <= 34: smeterBar.set_value(100, lv.ANIM.OFF)  # S5
-        elif radio.rssi > 34 and radio.rssi <= 44: smeterBar.set_value(110, lv.ANIM.OFF)  # S6
-        elif radio.rssi > 44 and radio.rssi <= 54: smeterBar.set_value(120, lv.ANIM.OFF)  # S7
-        elif radio.rssi > 54 and radio.rssi <= 64: smeterBar.set_value(130, lv.ANIM.OFF)  # S8
-        elif radio.rssi > 64 and radio.rssi <= 74: smeterBar.set_value(140, lv.ANIM.OFF)  # S9
-        elif radio.rssi > 74:                      smeterBar.set_value(150, lv.ANIM.OFF)  # S9 +60
-        elif radio.rssi > 76:                      smeterBar.set_value(160, lv.ANIM.OFF)  #>S9 +60
-
-    labelSnr.set_text(str(radio.snr) + "dB")
-    labelSTBLEND.set_text("Stereo " + str(radio.stblend) + "%")
-    labelSTBLEND.set_style_bg_color(lv.color_make(255,255-radio.stblend,255-radio.stblend), lv.PART.MAIN | lv.STATE.DEFAULT )
-    if volumeSlider.get_value() != config["Vol"]:
-        config["Vol"] = volumeSlider.get_value()
-        with open(configFileName, 'w') as f: json.dump(config, f)
-    if kbdTextArea.get_text() != config["Freq"] and len(kbdTextArea.get_text()) > 3:
-        config["Freq"] = kbdTextArea.get_text()
-        with open(configFileName, 'w') as f: json.dump(config, f)
-    if radio.fast == True:
-        if radio.modeIdx == 0:
-            radio.FM_TUNE_FREQ(radio.freq)
+        rdsDecoder.decode(radio.rds)
+    changed = rdsDecoder.takeChanged()
+    if changed & (rds.CHANGED_PS | rds.CHANGED_PTY):
+        if rdsDecoder.psValid:
+            labelTitle.set_text(rdsDecoder.psText() + "\n" + rdsDecoder.ptyText())
         else:
-            radio.AM_TUNE_FREQ(radio.freq)
+            labelTitle.set_text(TITLE)
+    if changed & rds.CHANGED_RT:
+        labelRt.set_text(rdsDecoder.rtText())
+
+    if dirty & Si4735.DIRTY_RSSI:
+        labelSignal.set_text(str(radio.rssi) + "dBuV")
+    bar = meter.update(radio.modeIdx, radio.rssi)
+    if bar >= 0:
+        smeterBar.set_value(bar, lv.ANIM.OFF)
+
+    if dirty & Si4735.DIRTY_SNR:
+        labelSnr.set_text(str(radio.snr) + "dB")
+    if dirty & Si4735.DIRTY_STBLEND:
+        labelSTBLEND.set_text("Stereo " + str(radio.stblend) + "%")
+        labelSTBLEND.set_style_bg_color(lv.color_make(255,255-radio.stblend,255-radio.stblend), lv.PART.MAIN | lv.STATE.DEFAULT )
+
+timer1 = lv.timer_create(updateScreen, shownPeriod, None)
 
-timer1 = lv.timer_create(updateScreen, 700, None)
\ No newline at end of file
+uasyncio.Loop.run_forever()
@@ -0,0 +1,73 @@
+import gc
+from micropython import const
+import perf
+
+GC_THRESHOLD = const(48 * 1024)     # the allocator collects by itself after this much
+IDLE_COLLECT = const(12 * 1024)     # allocated since the last collection before an idle frame collects
+LOW_WATER = const(20 * 1024)        # free heap below this: collect, then shed caches
+LOW_STEP = const(2 * 1024)          # at low water, collect again only after this much allocation
+
+class MemMgr(object):
+    '''
+    Moves garbage collection into idle frames. frame() runs after every LVGL refresh; in an
+    idle frame it collects once IDLE_COLLECT bytes were allocated since the last collection,
+    so the gc.threshold() collection of the allocator rarely hits a touch or a flush.
+    When the free heap is below LOW_WATER, it collects and calls the shedders in the order
+    they were added, until the heap is above LOW_WATER again.
+
+    *peaks* maps the screen names given to setScreen() to the highest gc.mem_alloc() seen
+    while the screen was shown; *collects* and *sheds* count what frame() did.
+    '''
+    def __init__(self, threshold=GC_THRESHOLD, idleCollect=IDLE_COLLECT, lowWater=LOW_WATER):
+        self.idleCollect = idleCollect
+        self.lowWater = lowWater
+        self.shedders = []
+        self.screen = ''
+        self.peaks = {'': 0}
+        self.collects = 0
+        self.sheds = 0
+        gc.threshold(threshold)
+        self.collect()
+
+    def addShedder(self, fn):
+        'fn() frees a cache and returns True if there was one to free.'
+        self.shedders.append(fn)
+
+    def setScreen(self, name):
+        self.screen = name
+        if name not in self.peaks:
+            self.peaks[name] = 0
+
+    def collect(self):
+        gc.collect()
+        self.collects += 1
+        self.base = gc.mem_alloc()      # in use right after the last collection
+
+    def frame(self, idle):
+        alloc = gc.mem_alloc()
+        free = gc.mem_free()
+        perf.heap.add(free)
+        if alloc > self.peaks[self.screen]:
+            self.peaks[self.screen] = alloc
+        if alloc < self.base:
+            self.base = alloc           # the allocator has collected
+        grown = alloc - self.base
+        if free < self.lowWater:
+            if grown > LOW_STEP:
+                self.collect()
+                self.shed()
+        elif idle and grown > self.idleCollect:
+            self.collect()
+
+    def shed(self):
+        for fn in self.shedders:
+            if gc.mem_free() >= self.lowWater:
+                return
+            if fn():
+                self.sheds += 1
+                self.collect()
+
+    def text(self):
+        'Heap peaks per screen and counters, for the diagnostics tab.'
+        return 'peak ' + ' '.join(['{}:{:d}'.format(k, self.peaks[k]) for k in self.peaks if k]) + \
+               ' gc {:d} shed {:d}'.format(self.collects, self.sheds)
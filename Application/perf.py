@@ -0,0 +1,88 @@
+import array
+from micropython import const
+
+BUCKETS = const(10)             # bucket i: values below 2**(2*i+2), the last one all above
+COUNT_MASK = const(0x3FFFFFFF)  # counts wrap instead of growing into long ints
+
+stats = []                      # every Hist and Gauge, in creation order
+
+class Hist(object):
+    '''
+    Count, average, maximum and a histogram of non-negative ints, e.g. microseconds from
+    time.ticks_diff, bytes or poll counts. Buckets grow by a factor of 4: <4, <16, <64 ...
+    add() allocates nothing, so it may run in a hard IRQ handler.
+    '''
+    def __init__(self, name, unit='us'):
+        self.name = name
+        self.unit = unit
+        self.buckets = array.array('I', bytes(4 * BUCKETS))
+        self.reset()
+
+    def reset(self):
+        for i in range(BUCKETS):
+            self.buckets[i] = 0
+        self.count = 0
+        self.avg = 0                    # moving average over the last ~8 values
+        self.max = 0
+
+    def add(self, v):
+        self.count = (self.count + 1) & COUNT_MASK
+        self.avg += (v - self.avg) >> 3
+        if v > self.max:
+            self.max = v
+        b = 0
+        v >>= 2
+        while v and b < BUCKETS - 1:
+            v >>= 2
+            b += 1
+        self.buckets[b] = (self.buckets[b] + 1) & COUNT_MASK
+
+    def line(self):
+        return '{} {:d} {:d}/{:d}{} [{}]'.format(self.name, self.count, self.avg, self.max, self.unit,
+                                                 ' '.join([str(n) for n in self.buckets]))
+
+class Gauge(object):
+    'Last, lowest and highest value of a level, e.g. free heap.'
+    def __init__(self, name, unit=''):
+        self.name = name
+        self.unit = unit
+        self.reset()
+
+    def reset(self):
+        self.last = 0
+        self.low = -1
+        self.high = 0
+
+    def add(self, v):
+        self.last = v
+        if v < self.low or self.low < 0:
+            self.low = v
+        if v > self.high:
+            self.high = v
+
+    def line(self):
+        return '{} {:d} {:d}..{:d}{}'.format(self.name, self.last, self.low, self.high, self.unit)
+
+def hist(name, unit='us'):
+    h = Hist(name, unit)
+    stats.append(h)
+    return h
+
+def gauge(name, unit=''):
+    g = Gauge(name, unit)
+    stats.append(g)
+    return g
+
+heap = gauge('heap', 'B')         # free heap, sampled by memmgr.MemMgr.frame()
+
+def reset():
+    for s in stats:
+        s.reset()
+
+def text():
+    'One line per statistic, for the diagnostics tab.'
+    return '\n'.join([s.line() for s in stats])
+
+def dump():
+    'The whole set as one compact line, e.g. over the REPL: import perf; perf.dump()'
+    print(' | '.join([s.line() for s in stats]))
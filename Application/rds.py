@@ -0,0 +1,194 @@
+import array
+from micropython import const
+
+RING_GROUPS = const(32)         # groups kept between two decodes (the chip FIFO holds 25)
+BLE_MAX = const(1)              # highest block error level used: 1-2 bit errors corrected
+PS_LEN = const(8)
+RT_LEN = const(64)
+
+# Decoder.takeChanged() bits
+CHANGED_PI  = const(0x01)
+CHANGED_PTY = const(0x02)
+CHANGED_PS  = const(0x04)
+CHANGED_RT  = const(0x08)
+CHANGED_ALL = const(0x0F)
+
+PTY_NAMES = ('', 'News', 'Affairs', 'Info', 'Sport', 'Educate', 'Drama', 'Culture',
+             'Science', 'Varied', 'Pop M', 'Rock M', 'Easy M', 'Light M', 'Classics', 'Other M',
+             'Weather', 'Finance', 'Children', 'Social', 'Religion', 'Phone In', 'Travel', 'Leisure',
+             'Jazz', 'Country', 'Nation M', 'Oldies', 'Folk M', 'Document', 'TEST', 'Alarm !')
+
+class GroupRing(object):
+    '''
+    Raw RDS groups as the chip delivered them: blocks A-D and their error levels. The oldest
+    group is overwritten when the ring is full. Nothing is allocated after construction.
+    '''
+    def __init__(self, size=RING_GROUPS):
+        self.size = size
+        self.blocks = array.array('H', bytes(8 * size))
+        self.ble = bytearray(size)
+        self.head = 0                   # next group written
+        self.count = 0
+        self.dropped = 0
+
+    def clear(self):
+        self.count = 0
+
+    def put(self, resp):
+        'Store the group of an FM_RDS_STATUS response *resp* (13 bytes).'
+        i = self.head
+        j = i * 4
+        b = self.blocks
+        b[j] = resp[4] << 8 | resp[5]
+        b[j + 1] = resp[6] << 8 | resp[7]
+        b[j + 2] = resp[8] << 8 | resp[9]
+        b[j + 3] = resp[10] << 8 | resp[11]
+        self.ble[i] = resp[12]
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        else:
+            self.dropped += 1
+
+class Decoder(object):
+    '''
+    Incremental decoder of PI, PTY, PS (group 0) and RadioText (group 2). Blocks with an
+    error level above BLE_MAX are ignored one by one, so a bad block C does not cost the PS
+    segment in block D. PS and RT are only published when all their segments have arrived
+    and the text differs from the shown one. Decoding a group allocates nothing; only the
+    *Text() methods create strings, for the labels.
+    '''
+    def __init__(self):
+        self.ps = bytearray(PS_LEN)
+        self.psShown = bytearray(PS_LEN)
+        self.rt = bytearray(RT_LEN)
+        self.rtShown = bytearray(RT_LEN)
+        self.reset()
+
+    def reset(self):
+        'Forget the station, e.g. after a tune.'
+        self.pi = -1
+        self.pty = -1
+        self.psMask = 0
+        self.rtMask = 0
+        self.rtAb = -1
+        self.rtEnd = 16                 # segments of the text, fewer once the end mark (0x0D) is seen
+        self.rtLen = 0
+        self.psValid = False
+        for i in range(PS_LEN):
+            self.ps[i] = 0x20
+            self.psShown[i] = 0x20
+        self.changed = CHANGED_ALL
+        self.groups = 0
+        self.errors = 0
+
+    def takeChanged(self):
+        c = self.changed
+        self.changed = 0
+        return c
+
+    def decode(self, ring):
+        'Decode and remove the groups waiting in *ring*.'
+        size = ring.size
+        i = (ring.head - ring.count) % size
+        while ring.count:
+            self.group(ring.blocks, i * 4, ring.ble[i])
+            ring.count -= 1
+            i = (i + 1) % size
+
+    def group(self, b, j, ble):
+        self.groups += 1
+        if (ble >> 4) & 3 > BLE_MAX:                # block B is needed for everything
+            self.errors += 1
+            return
+        if ble >> 6 <= BLE_MAX:
+            pi = b[j]
+            if pi != self.pi:
+                if self.pi >= 0:
+                    self.reset()                    # another station
+                self.pi = pi
+                self.changed |= CHANGED_PI
+        blockB = b[j + 1]
+        pty = (blockB >> 5) & 0x1F
+        if pty != self.pty:
+            self.pty = pty
+            self.changed |= CHANGED_PTY
+        okC = (ble >> 2) & 3 <= BLE_MAX
+        okD = ble & 3 <= BLE_MAX
+        gtype = blockB >> 12
+        if gtype == 0 and okD:
+            seg = blockB & 0x03
+            self.putChar(self.ps, seg * 2, b[j + 3] >> 8)
+            self.putChar(self.ps, seg * 2 + 1, b[j + 3] & 0xFF)
+            self.psMask |= 1 << seg
+            if self.psMask == 0x0F:
+                self.psMask = 0
+                self.publishPs()
+        elif gtype == 2:
+            ab = (blockB >> 4) & 1
+            if ab != self.rtAb:                     # text A/B flag: a new text follows
+                self.rtAb = ab
+                self.rtMask = 0
+                self.rtEnd = 16
+                for i in range(RT_LEN):
+                    self.rt[i] = 0x20
+            seg = blockB & 0x0F
+            if blockB & 0x0800:                     # version B: 2 characters in block D
+                if not okD:
+                    return
+                self.rtChar(seg, seg * 2, b[j + 3] >> 8, 2)
+                self.rtChar(seg, seg * 2 + 1, b[j + 3] & 0xFF, 2)
+            else:
+                if not (okC and okD):
+                    return
+                self.rtChar(seg, seg * 4, b[j + 2] >> 8, 4)
+                self.rtChar(seg, seg * 4 + 1, b[j + 2] & 0xFF, 4)
+                self.rtChar(seg, seg * 4 + 2, b[j + 3] >> 8, 4)
+                self.rtChar(seg, seg * 4 + 3, b[j + 3] & 0xFF, 4)
+            self.rtMask |= 1 << seg
+            full = (1 << self.rtEnd) - 1
+            if self.rtMask & full == full:
+                self.rtMask = 0
+                self.publishRt()
+
+    def putChar(self, buf, pos, c):
+        buf[pos] = c if 0x20 <= c < 0x7F else 0x20
+
+    def rtChar(self, seg, pos, c, width):
+        'Character *c* at *pos* of segment *seg*, which holds *width* characters (2 in group 2B, 4 in 2A).'
+        if c == 0x0D:
+            self.rtEnd = seg + 1
+            for i in range(pos, RT_LEN):
+                self.rt[i] = 0x20
+        elif pos < self.rtEnd * width:
+            self.putChar(self.rt, pos, c)
+
+    def publishPs(self):
+        if self.psValid and self.ps == self.psShown:
+            return
+        for i in range(PS_LEN):
+            self.psShown[i] = self.ps[i]
+        self.psValid = True
+        self.changed |= CHANGED_PS
+
+    def publishRt(self):
+        n = RT_LEN
+        while n > 0 and self.rt[n - 1] == 0x20:
+            n -= 1
+        same = n == self.rtLen
+        for i in range(n):
+            if self.rtShown[i] != self.rt[i]:
+                same = False
+                self.rtShown[i] = self.rt[i]
+        if not same:
+            self.rtLen = n
+            self.changed |= CHANGED_RT
+
+    def psText(self):
+        return str(memoryview(self.psShown), 'ascii')
+
+    def rtText(self):
+        return str(memoryview(self.rtShown)[:self.rtLen], 'ascii')
+
+    def ptyText(self):
+        return PTY_NAMES[self.pty] if self.pty >= 0 else ''
@@ -6,38 +6,169 @@ import sys
 
 if sys.platform!='rp2': raise ImportError('This module can only be meaningfully used on the rp2 platform.')
 
+try:
+    from rp2 import DMA as _rp2DMA     # MicroPython 1.21+: channel claiming and completion IRQs
+except ImportError:
+    _rp2DMA = None
+
+CHANNELS = const(12)
+DEFAULT_CHANNEL = const(1)              # first channel handed out when rp2.DMA is missing
+_claimed = 0                            # channels in use, one bit each
+
+# DREQ numbers (TREQ_SEL), RP2040 datasheet 2.5.3.1
+DREQ_PIO0_TX0 = const(0)                # + state machine
+DREQ_PIO0_RX0 = const(4)
+DREQ_PIO1_TX0 = const(8)
+DREQ_PIO1_RX0 = const(12)
+DREQ_SPI0_TX  = const(16)
+DREQ_SPI0_RX  = const(17)
+DREQ_SPI1_TX  = const(18)
+DREQ_SPI1_RX  = const(19)
+DREQ_PERMANENT= const(0x3F)
+
+SPI_BASE = (0x4003C000, 0x40040000)
+SSPDR = const(0x008)
+SSPSR = const(0x00C)
+SSPSR_BSY = const(0x10)
+PIO_BASE = (0x50200000, 0x50300000)
+PIO_TXF0 = const(0x010)
+PIO_RXF0 = const(0x020)
+
+def spiTx(spi_id):
+    'Destination address and DREQ number for DMA writes to SPI *spi_id*.'
+    return SPI_BASE[spi_id] + SSPDR, DREQ_SPI1_TX if spi_id else DREQ_SPI0_TX
+
+def spiRx(spi_id):
+    'Source address and DREQ number for DMA reads from SPI *spi_id*.'
+    return SPI_BASE[spi_id] + SSPDR, DREQ_SPI1_RX if spi_id else DREQ_SPI0_RX
+
+def spiStatus(spi_id):
+    'Address of the SSPSR register of SPI *spi_id*; bit SSPSR_BSY is set while it shifts data.'
+    return SPI_BASE[spi_id] + SSPSR
+
+def pioTx(pio, sm):
+    'Destination address and DREQ number for DMA writes to the TX FIFO of state machine *sm* of PIO *pio*.'
+    return PIO_BASE[pio] + PIO_TXF0 + 4 * sm, (DREQ_PIO1_TX0 if pio else DREQ_PIO0_TX0) + sm
+
+def pioRx(pio, sm):
+    return PIO_BASE[pio] + PIO_RXF0 + 4 * sm, (DREQ_PIO1_RX0 if pio else DREQ_PIO0_RX0) + sm
+
 class DMA:
+    '''
+    One DMA channel. The registers are written directly, so transfers can be set up
+    without allocating; rp2.DMA (MicroPython 1.21+) is only used to claim the channel and
+    to get its completion IRQ.
+    '''
     DMA_BASE  = const(0x50000000)
 
     DMA_EN    = const(0x01 << 0)
     HIGH_PRIO = const(0x01 << 1)
+    DATA_SIZE_SHIFT = const(2)
     INCR_READ = const(0x01 << 4)
     INCR_WRITE= const(0x01 << 5)
+    RING_SIZE_SHIFT = const(6)
+    RING_SEL  = const(0x01 << 10)
+    CHAIN_TO_SHIFT = const(11)
+    TREQ_SEL_SHIFT = const(15)
     DREQ_PIO0_RX0 = const(0x04 << 15)
     DREQ_SPI1_TX  = const(0x12 << 15)
     DREQ_PERMANENT= const(0x3F << 15)
     IRQ_QUIET = const(0x01 << 21)
     BUSY      = const(0x01 << 24)
 
-    def __init__( self, channelNumber ):
+    def __init__( self, channelNumber = None ):
+        '''
+        *channelNumber* None claims a free channel, through rp2.DMA where the firmware has
+        it, which also makes irq() available.
+        '''
+        global _claimed
+        self.ch = None
+        if channelNumber is None:
+            if _rp2DMA is not None:
+                self.ch = _rp2DMA()
+                channelNumber = self.ch.channel
+            else:
+                for channelNumber in range(DEFAULT_CHANNEL, CHANNELS):
+                    if not _claimed & (1 << channelNumber):
+                        break
+                else:
+                    raise OSError('no free DMA channel')
+        elif _claimed & (1 << channelNumber):
+            raise ValueError('DMA channel %d in use' % channelNumber)
+        _claimed |= 1 << channelNumber
+        self.channel = channelNumber
         offset = channelNumber * 0x40
         self.CHx_READ_ADDR     = DMA.DMA_BASE + 0x00 + offset
         self.CHx_WRITE_ADDR    = DMA.DMA_BASE + 0x04 + offset
         self.CHx_TRANS_COUNT   = DMA.DMA_BASE + 0x08 + offset
         self.CHx_CTRL_TRIG     = DMA.DMA_BASE + 0x0C + offset
+        self.CHx_AL1_CTRL      = DMA.DMA_BASE + 0x10 + offset   # same register, no trigger
+        self.CHx_AL3_TRANS_COUNT = DMA.DMA_BASE + 0x38 + offset
+        self.CHx_AL3_READ_ADDR_TRIG = DMA.DMA_BASE + 0x3C + offset
+
+    def close( self ):
+        'Stop the channel and give it back.'
+        global _claimed
+        self.disable()
+        if self.ch is not None:
+            self.ch.irq(handler=None)
+            self.ch.close()
+            self.ch = None
+        _claimed &= ~(1 << self.channel)
+
+    def irq( self, handler ):
+        '''
+        Call *handler(dma)* in hard IRQ context when a transfer has finished, or with
+        IRQ_QUIET at the end of a chain. Returns False if the firmware offers no DMA
+        interrupts (MicroPython before 1.21 or a channel given by number).
+        '''
+        if self.ch is None:
+            return False
+        self.ch.irq(handler=handler, hard=True)
+        return True
 
-    def config( self, src_addr, dst_addr, count, src_inc, dst_inc, trig_dreq ):
+    def ctrl( self, src_inc, dst_inc, trig_dreq, size = 1, ring_bits = 0, ring_write = False, chain_to = None, quiet = False ):
+        '''
+        CTRL register value, without DMA_EN. *trig_dreq* is a DREQ_* number or, as before, a
+        DMA.DREQ_* value already shifted into place. *size* is the transfer size in bytes (1,
+        2 or 4); *ring_bits* wraps the read (or with *ring_write* the write) address on a
+        2**ring_bits byte boundary; *chain_to* is the channel triggered when this one finishes.
+        '''
+        val = (size >> 1) << DMA.DATA_SIZE_SHIFT
+        if( src_inc ):
+            val |= DMA.INCR_READ
+        if( dst_inc ):
+            val |= DMA.INCR_WRITE
+        val |= trig_dreq if trig_dreq > DREQ_PERMANENT else trig_dreq << DMA.TREQ_SEL_SHIFT
+        if ring_bits:
+            val |= ring_bits << DMA.RING_SIZE_SHIFT
+            if ring_write:
+                val |= DMA.RING_SEL
+        val |= (self.channel if chain_to is None else chain_to) << DMA.CHAIN_TO_SHIFT
+        if quiet:
+            val |= DMA.IRQ_QUIET
+        return val
+
+    def config( self, src_addr, dst_addr, count, src_inc, dst_inc, trig_dreq, size = 1, ring_bits = 0, ring_write = False, chain_to = None, quiet = False, enable = False ):
+        '''
+        Set up a transfer of *count* items of *size* bytes; see ctrl() for the options.
+        The transfer starts with enable(), or, with *enable*, when another channel triggers
+        this one (chaining or a control block write).
+        '''
         machine.mem32[ self.CHx_CTRL_TRIG ]   = 0
         machine.mem32[ self.CHx_READ_ADDR ]   = src_addr
         machine.mem32[ self.CHx_WRITE_ADDR ]  = dst_addr
         machine.mem32[ self.CHx_TRANS_COUNT ] = count
-        trig_val = 0
-        if( src_inc ):
-            trig_val |= DMA.INCR_READ
-        if( dst_inc ):
-            trig_val |= DMA.INCR_WRITE
-        trig_val |= trig_dreq
-        machine.mem32[ self.CHx_CTRL_TRIG ]   = trig_val
+        val = self.ctrl(src_inc, dst_inc, trig_dreq, size, ring_bits, ring_write, chain_to, quiet)
+        if enable:
+            machine.mem32[ self.CHx_AL1_CTRL ] = val | DMA.DMA_EN
+        else:
+            machine.mem32[ self.CHx_CTRL_TRIG ] = val
+
+    def start( self, src_addr, count ):
+        'Start the configured channel again on *count* items from *src_addr*.'
+        machine.mem32[ self.CHx_AL3_TRANS_COUNT ] = count
+        machine.mem32[ self.CHx_AL3_READ_ADDR_TRIG ] = src_addr
 
     def enable( self ):
         machine.mem32[ self.CHx_CTRL_TRIG ] |= DMA.DMA_EN
@@ -50,3 +181,35 @@ class DMA:
             return True
         else:
             return False
+
+class Chain:
+    '''
+    A list of transfers run by channel *data* without the CPU. Channel *ctrl* copies the
+    next (count, read address) pair of *blocks* (array('I')) into the alias 3 registers of
+    *data*, which starts it; *data* chains back to *ctrl* when done. A (0, 0) pair is a
+    null trigger: it ends the chain and, with *data* set up quiet, raises its IRQ.
+
+    *data* must be configured beforehand with config(..., chain_to=ctrl.channel,
+    enable=True) for its destination, DREQ and size.
+    '''
+    def __init__( self, data, ctrl ):
+        self.data = data
+        self.ctrl = ctrl
+
+    def start( self, blocks ):
+        self.ctrl.config(
+            src_addr   = uctypes.addressof(blocks),
+            dst_addr   = self.data.CHx_AL3_TRANS_COUNT,
+            count      = 2,
+            src_inc    = True,
+            dst_inc    = True,
+            trig_dreq  = DREQ_PERMANENT,
+            size       = 4,
+            ring_bits  = 3,         # two words, into TRANS_COUNT and READ_ADDR_TRIG
+            ring_write = True,
+            quiet      = True
+        )
+        self.ctrl.enable()
+
+    def is_busy( self ):
+        return self.ctrl.is_busy() or self.data.is_busy()
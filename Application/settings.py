@@ -0,0 +1,151 @@
+import os
+import time
+import json
+from micropython import const
+
+WRITE_DELAY_MS = const(3000)    # write once nothing changed for this long
+LOG_MAX_BYTES = const(2048)     # start the next log file beyond this size
+LOG_FILES = ('settings0.log', 'settings1.log', 'settings2.log')
+LEGACY_FILE = 'config.json'
+
+DEFAULTS = {
+    'Vol': 30,
+    'Freq': '88.1MHz',
+    'FmStep': 5,            # freqStep index used in FM
+    'AmStep': 1,            # freqStep index used in AM/SW/LW
+    'TouchCal': '',         # touchcal.calText() of the touch calibration, '' for the default ranges
+}
+
+def checksum(text):
+    c = 0
+    for ch in text:
+        c = (c + ord(ch)) & 0xFF
+    return c
+
+def record(key, value):
+    text = '%s=%s' % (key, value)
+    return '%s*%02x\n' % (text, checksum(text))
+
+def parseRecord(line):
+    'Return (key, value text) of one log line, or None if it is cut short or damaged.'
+    if not line.endswith('\n'):
+        return None
+    text, sep, cs = line[:-1].rpartition('*')
+    if not sep or cs != '%02x' % checksum(text):
+        return None
+    key, sep, value = text.partition('=')
+    if not sep:
+        return None
+    return key, value
+
+class Settings(object):
+    '''
+    Persistent settings with write-behind: set() only updates memory, flush() appends the
+    changed values to a record log once they have been quiet for WRITE_DELAY_MS.
+
+    The log rotates over LOG_FILES; every file starts with a generation record followed by a
+    full snapshot, so a file cut short by a power loss falls back to the older files, and
+    missing or damaged files fall back to DEFAULTS.
+    '''
+    def __init__(self, defaults=DEFAULTS, files=LOG_FILES, legacy=LEGACY_FILE):
+        self.defaults = defaults
+        self.files = files
+        self.values = dict(defaults)
+        self.pending = {}
+        self.changedAt = 0
+        self.gen = 0
+        self.fileIdx = len(files) - 1
+        self.size = LOG_MAX_BYTES       # no log yet: the first flush starts a file
+        self.writes = 0
+        if not self.load():
+            self.migrate(legacy)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key):
+        return self.values[key]
+
+    def set(self, key, value):
+        if self.values.get(key) == value:
+            return
+        self.values[key] = value
+        self.pending[key] = value
+        self.changedAt = time.ticks_ms()
+
+    def apply(self, key, text):
+        if key not in self.defaults:
+            return
+        try:
+            self.values[key] = type(self.defaults[key])(text)
+        except ValueError:
+            pass
+
+    def readLog(self, name):
+        'Valid records of log file *name* up to the first damaged one.'
+        recs = []
+        try:
+            with open(name, 'r') as f:
+                for line in f:
+                    rec = parseRecord(line)
+                    if rec is None:
+                        break
+                    recs.append(rec)
+        except OSError:
+            pass
+        return recs
+
+    def load(self):
+        logs = []
+        for i in range(len(self.files)):
+            recs = self.readLog(self.files[i])
+            if recs and recs[0][0] == '#':
+                try:
+                    logs.append((int(recs[0][1]), i, recs))
+                except ValueError:
+                    pass
+        if not logs:
+            return False
+        logs.sort()
+        for gen, i, recs in logs:
+            for key, text in recs[1:]:
+                self.apply(key, text)
+        self.gen, self.fileIdx = logs[-1][0], logs[-1][1]
+        try:
+            self.size = os.stat(self.files[self.fileIdx])[6]
+        except OSError:
+            pass
+        return True
+
+    def migrate(self, legacy):
+        'Take over the values of the old config.json, if it is readable.'
+        try:
+            with open(legacy, 'r') as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key in old:
+            if key in self.defaults and type(old[key]) == type(self.defaults[key]):
+                self.set(key, old[key])
+
+    def flush(self, force=False):
+        'Write pending changes if they have been quiet long enough; True if written.'
+        if not self.pending:
+            return False
+        if not force and time.ticks_diff(time.ticks_ms(), self.changedAt) < WRITE_DELAY_MS:
+            return False
+        data = ''.join([record(key, self.pending[key]) for key in self.pending])
+        if self.size + len(data) > LOG_MAX_BYTES:
+            self.gen += 1
+            self.fileIdx = (self.fileIdx + 1) % len(self.files)
+            data = record('#', self.gen) + ''.join([record(key, self.values[key]) for key in self.values])
+            mode = 'w'
+            self.size = 0
+        else:
+            mode = 'a'
+        with open(self.files[self.fileIdx], mode) as f:
+            f.write(data)
+        self.size += len(data)
+        self.pending = {}
+        self.writes += 1
+        return True
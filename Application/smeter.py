@@ -0,0 +1,84 @@
+from micropython import const
+
+EMA_SHIFT = const(1)        # release: the smoothed RSSI moves 1/2 of the way per tick
+PEAK_HOLD = const(2)        # ticks a new peak stays on the bar before it may fall
+
+# S-unit scales as (highest RSSI in dBuV, bar value) steps; above the last step the bar is full.
+FM_UNITS = (
+    ( 1,  50),   # S0
+    ( 2,  60),   # S1
+    ( 8,  70),   # S2
+    (14,  80),   # S3
+    (24,  90),   # S4
+    (34, 100),   # S5
+    (44, 110),   # S6
+    (54, 120),   # S7
+    (64, 130),   # S8
+    (74, 140),   # S9
+    (127, 150),  # S9 +60
+)
+AM_UNITS = (
+    ( 1,   0),   # S0
+    ( 2,  10),   # S1
+    ( 3,  20),   # S2
+    ( 4,  30),   # S3
+    (10,  40),   # S4
+    (16,  50),   # S5
+    (22,  60),   # S6
+    (28,  70),   # S7
+    (34,  80),   # S8
+    (44,  90),   # S9
+    (54, 100),   # S9 +10
+    (64, 110),   # S9 +20
+    (74, 120),   # S9 +30
+    (84, 130),   # S9 +40
+    (94, 140),   # S9 +50
+    (127, 150),  # S9 +60
+)
+
+def buildTable(units):
+    'RSSI (0..127 dBuV) to bar value lookup table for the S-unit steps *units*.'
+    table = bytearray(128)
+    rssi = 0
+    for top, value in units:
+        while rssi <= top and rssi < 128:
+            table[rssi] = value
+            rssi += 1
+    return table
+
+class SMeter(object):
+    '''
+    Maps RSSI to the S-meter bar with one table lookup per tick. The RSSI is smoothed in
+    4-bit fixed point: it rises at once and falls as an exponential moving average, and a
+    new peak is held for PEAK_HOLD ticks.
+    '''
+    tables = (buildTable(FM_UNITS), buildTable(AM_UNITS))
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.acc = 0
+        self.peak = 0
+        self.hold = 0
+        self.shown = -1
+
+    def update(self, modeIdx, rssi):
+        'Feed one RSSI reading; returns the new bar value, or -1 if the bar is unchanged.'
+        x = min(max(rssi, 0), 127) << 4
+        if x > self.acc:
+            self.acc = x
+        else:
+            self.acc -= (self.acc - x) >> EMA_SHIFT
+        value = self.tables[0 if modeIdx == 0 else 1][self.acc >> 4]
+        if value >= self.peak:
+            self.peak = value
+            self.hold = PEAK_HOLD
+        elif self.hold > 0:
+            self.hold -= 1
+        else:
+            self.peak = value
+        if self.peak == self.shown:
+            return -1
+        self.shown = self.peak
+        return self.peak
@@ -0,0 +1,135 @@
+import os
+import struct
+import binascii
+from micropython import const
+from freqfmt import parseFreq
+
+# N.idx layout: header, fixed size records, then the UTF-8 names back to back.
+#   header: magic, record count, size and CRC-32 of the N.txt it was built from
+#   record: kHz (0 for a heading), band index (BAND_HEADING for a heading, BAND_NONE outside
+#           every band), name length, name offset
+MAGIC = b'STX2'
+HEADER_FMT = '<4sHII'
+RECORD_FMT = '<IBBH'
+HEADER_SIZE = const(14)
+RECORD_SIZE = const(8)
+BAND_HEADING = const(0xFF)
+BAND_NONE = const(0xFE)
+NAME_MAX = const(255)
+COPY_CHUNK = const(256)
+
+def build(src, dst, bandIndex):
+    '''
+    Compile the name/frequency line pairs of *src* into the index *dst*. *bandIndex* maps kHz
+    to the mode index (Si4735.bandIndex). Pairs without a frequency are headings; the stations between two
+    headings are sorted by frequency. Names go to a temporary file while reading, so only the
+    record fields are held in RAM.
+    '''
+    khz = []
+    band = bytearray()
+    nlen = bytearray()
+    noff = []
+    tmp = dst + '.tmp'
+    pos = 0
+    with open(src, 'rb') as f:
+        with open(tmp, 'wb') as blob:
+            while True:
+                name = f.readline()
+                if not name:
+                    break
+                name = name.rstrip(b'\r\n')[:NAME_MAX]
+                k = parseFreq(f.readline().rstrip(b'\r\n').decode())
+                blob.write(name)
+                khz.append(max(k, 0))
+                b = bandIndex(k) if k >= 0 else -1
+                band.append(BAND_HEADING if k < 0 else BAND_NONE if b < 0 else b)
+                nlen.append(len(name))
+                noff.append(pos)
+                pos += len(name)
+    # sort the stations of each section, keep the headings in place
+    order = []
+    section = []
+    for i in range(len(khz)):
+        if band[i] == BAND_HEADING:
+            section.sort(key=lambda j: khz[j])
+            order.extend(section)
+            section = []
+            order.append(i)
+        else:
+            section.append(i)
+    section.sort(key=lambda j: khz[j])
+    order.extend(section)
+    rec = bytearray(RECORD_SIZE)
+    buf = bytearray(COPY_CHUNK)
+    with open(dst, 'wb') as f:
+        f.write(struct.pack(HEADER_FMT, MAGIC, len(order), os.stat(src)[6], checksum(src, buf)))
+        for i in order:
+            struct.pack_into(RECORD_FMT, rec, 0, khz[i], band[i], nlen[i], noff[i])
+            f.write(rec)
+        with open(tmp, 'rb') as blob:
+            while True:
+                n = blob.readinto(buf)
+                if not n:
+                    break
+                f.write(buf if n == COPY_CHUNK else buf[:n])
+    os.remove(tmp)
+
+def checksum(src, buf):
+    'CRC-32 of file *src*, read in chunks into *buf*. A few ms for an area file.'
+    crc = 0
+    with open(src, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                return crc
+            crc = binascii.crc32(buf if n == len(buf) else buf[:n], crc)
+
+def isCurrent(src, dst):
+    '''
+    True if *dst* is an index built from the present *src*. The size is compared first, the
+    CRC catches edits of the same length; file times are no help, the Pico has no set clock.
+    '''
+    try:
+        with open(dst, 'rb') as f:
+            magic, count, size, crc = struct.unpack(HEADER_FMT, f.read(HEADER_SIZE))
+        return magic == MAGIC and size == os.stat(src)[6] and crc == checksum(src, bytearray(COPY_CHUNK))
+    except (OSError, ValueError):
+        return False
+
+class StationIndex(object):
+    '''
+    Reader of an N.idx file. Records are read with seek/readinto into buffers allocated once,
+    so looking at a station allocates only the name string handed to LVGL.
+    '''
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.rec = bytearray(RECORD_SIZE)
+        self.nameBuf = bytearray(NAME_MAX)
+        magic, self.count, size, crc = struct.unpack(HEADER_FMT, self.f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            self.f.close()
+            raise ValueError(path)
+        self.blob = HEADER_SIZE + self.count * RECORD_SIZE
+
+    def close(self):
+        self.f.close()
+
+    def record(self, i):
+        'Return (kHz, band, name length, name offset) of record *i*.'
+        self.f.seek(HEADER_SIZE + i * RECORD_SIZE)
+        self.f.readinto(self.rec)
+        return struct.unpack_from(RECORD_FMT, self.rec)
+
+    def name(self, length, offset):
+        mv = memoryview(self.nameBuf)[:length]
+        self.f.seek(self.blob + offset)
+        self.f.readinto(mv)
+        return str(mv, 'utf-8')
+
+def openArea(area, bandIndex):
+    'StationIndex of area file *area*.txt, (re)building *area*.idx when missing or stale.'
+    src = area + '.txt'
+    dst = area + '.idx'
+    if not isCurrent(src, dst):
+        build(src, dst, bandIndex)
+    return StationIndex(dst)
@@ -0,0 +1,61 @@
+import lvgl as lv
+from micropython import const
+import MSP2807_XPT2046
+
+MARGIN = const(24)              # targets this far from the edges
+
+def calText(cal):
+    'Settings text of calibration coefficients.'
+    return ','.join([str(v) for v in cal])
+
+def parseCal(text):
+    'Coefficients of calText() *text*, or None if it is empty or damaged.'
+    try:
+        cal = tuple([int(v) for v in text.split(',')])
+    except ValueError:
+        return None
+    return cal if len(cal) == 6 else None
+
+class TouchCal(object):
+    '''
+    Calibration screen: the user touches three crosses in turn, the raw readings behind the
+    touches give the affine map (MSP2807_XPT2046.affine), and the touch driver uses it from
+    then on. *done_cb(cal)* gets the coefficients to store them. Points on a line (a
+    slipped touch) start the round again. The previous screen comes back at the end.
+    '''
+    def __init__(self, touch, done_cb=None):
+        self.touch = touch
+        self.done_cb = done_cb
+        w, h = touch.size
+        self.targets = ((MARGIN, MARGIN), (w - MARGIN, h // 2), (w // 2, h - MARGIN))
+        self.raws = []
+        self.prev = lv.scr_act()
+        self.scr = lv.obj()
+        self.info = lv.label(self.scr)
+        self.info.set_text("Touch the cross")
+        self.info.align(lv.ALIGN.CENTER, 0, 0)
+        self.mark = lv.label(self.scr)
+        self.mark.set_text("+")
+        self.scr.add_event(self.clicked_cb, lv.EVENT.CLICKED, None)
+        self.showTarget()
+        lv.scr_load(self.scr)
+
+    def showTarget(self):
+        x, y = self.targets[len(self.raws)]
+        self.mark.align(lv.ALIGN.TOP_LEFT, x - 4, y - 8)
+
+    def clicked_cb(self, event):
+        self.raws.append(tuple(self.touch.raw))
+        if len(self.raws) < len(self.targets):
+            self.showTarget()
+            return
+        cal = MSP2807_XPT2046.affine(self.targets, self.raws)
+        self.raws = []
+        if cal is None:
+            self.showTarget()
+            return
+        self.touch.set_cal(cal)
+        if self.done_cb:
+            self.done_cb(cal)
+        lv.scr_load(self.prev)
+        self.scr.delete()
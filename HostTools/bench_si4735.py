@@ -0,0 +1,226 @@
+'''
+  Tuning-latency benchmark for Application/Si4735.py, run on the host against si4735_emu.
+
+  Every scenario reports I2C transactions, bytes on the wire, status (CTS) polls, bus time
+  and the time the caller was blocked inside the driver, all in simulated time at the
+  bus frequency used by main.py (50kHz).
+
+    python3 bench_si4735.py                    # print the table
+    python3 bench_si4735.py --save base.json   # store the results
+    python3 bench_si4735.py --check base.json  # fail if a scenario got more expensive
+    python3 bench_si4735.py --async            # Si4735_async; blocked = longest UI stall
+'''
+import os
+import sys
+import json
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(1, os.path.join(HERE, '..', 'Application'))
+
+import machine
+import si4735_emu
+import uasyncio
+import Si4735
+import Si4735_async
+
+METRICS = ('transactions', 'bytes', 'status_reads', 'bus_us', 'blocked_us')
+
+
+class Bench(object):
+    def __init__(self, freq=50_000, irq=False, asynchronous=False):
+        self.clock = si4735_emu.SimClock()
+        Si4735.time = self.clock
+        Si4735_async.time = self.clock
+        uasyncio.clock = self.clock
+        uasyncio.tasks = []
+        self.asynchronous = asynchronous
+        intPin = machine.Pin(28, machine.Pin.IN) if irq else None
+        chip = si4735_emu.Si4735Chip(self.clock, int_pin=intPin)
+        self.i2c = machine.I2C(0, scl=machine.Pin(21), sda=machine.Pin(20), freq=freq, clock=self.clock, chip=chip)
+        cls = Si4735_async.Si4735Async if asynchronous else Si4735.Si4735
+        self.radio = cls(self.i2c, 22, machine.Pin(26), machine.Pin(27), irq=intPin)
+        self.vol = 30
+        self.idle_us = 0
+
+    def idle(self, ms):
+        'Time spent outside the driver, e.g. between two screen ticks.'
+        if self.asynchronous:
+            # the worker keeps running meanwhile
+            uasyncio.run(until_us=self.clock.now_us + ms * 1000)
+        else:
+            self.clock.advance(ms * 1000)
+            self.idle_us += ms * 1000
+
+    def drain(self):
+        'Let the async worker finish the queue and a band switch its staged unmute.'
+        if self.asynchronous:
+            uasyncio.run(idle=lambda: not self.radio.busy() and self.radio.switchState == Si4735_async.SW_IDLE)
+
+    def tune(self, fkhz):
+        if self.asynchronous:
+            self.radio.requestTune(fkhz, self.vol)
+            self.drain()
+        else:
+            self.radio.tune(fkhz, self.vol)
+
+    def step(self, step):
+        if self.asynchronous:
+            self.radio.requestStep(step)
+        else:
+            self.radio.stepTune(step)
+
+    def seek(self, seekDir):
+        if self.asynchronous:
+            self.radio.requestSeek(seekDir)
+        else:
+            self.radio.seek(seekDir)
+
+    def tick(self):
+        'The radio side of main.updateScreen.'
+        if self.asynchronous:
+            self.radio.requestStatus()
+            self.radio.requestFinishFastTune()
+            self.drain()
+        else:
+            self.radio.updateStatus()
+            self.radio.finishFastTune()
+
+    def run(self, name, scenario, setup=None):
+        if setup:
+            setup(self)
+        self.i2c.reset_stats()
+        self.idle_us = 0
+        start = self.clock.now_us
+        hits = self.radio.propHits
+        self.radio.switchMs = 0
+        uasyncio.reset()
+        scenario(self)
+        res = dict(self.i2c.stats)
+        if self.asynchronous:
+            res['blocked_us'] = uasyncio.max_slice_us
+        else:
+            res['blocked_us'] = self.clock.now_us - start - self.idle_us
+        res['prop_hits'] = self.radio.propHits - hits
+        res['switch_ms'] = self.radio.switchMs
+        res['name'] = name
+        return res
+
+
+def sc_cold_fm(b):
+    b.tune(88100)
+
+def sc_retune_fm(b):
+    b.tune(84700)
+
+def sc_switch_am(b):
+    b.tune(594)
+
+def sc_switch_fm(b):
+    b.tune(81300)
+
+def sc_retune_am(b):
+    b.tune(954)
+
+def sc_step_fm(b):
+    for _ in range(10):
+        b.step(10)
+        b.idle(100)
+    b.tick()
+
+def sc_step_am(b):
+    for _ in range(10):
+        b.step(9)
+        b.idle(100)
+    b.tick()
+
+def sc_seek_fm(b):
+    b.seek(1)
+    for _ in range(200):
+        b.idle(100)
+        b.tick()
+        if not b.radio.seeking:
+            break
+
+def sc_tick(b):
+    b.tick()
+
+def in_fm(b):
+    if b.radio.modeIdx != 0:
+        b.tune(88100)
+
+def in_am(b):
+    if b.radio.modeIdx <= 0:
+        b.tune(954)
+
+SCENARIOS = [
+    ('tune FM cold',      sc_cold_fm,   None),
+    ('tune FM same band', sc_retune_fm, in_fm),
+    ('switch FM->AM',     sc_switch_am, in_fm),
+    ('tune AM same band', sc_retune_am, in_am),
+    ('switch AM->FM',     sc_switch_fm, in_am),
+    ('step FM x10',       sc_step_fm,   in_fm),
+    ('step AM x10',       sc_step_am,   in_am),
+    ('seek FM up',        sc_seek_fm,   in_fm),
+    ('updateScreen tick', sc_tick,      in_fm),
+]
+
+
+def run_all(freq, irq=False, asynchronous=False):
+    b = Bench(freq, irq, asynchronous)
+    return [b.run(name, sc, setup) for name, sc, setup in SCENARIOS]
+
+
+def print_table(results):
+    print('%-20s %6s %6s %6s %10s %11s %9s %9s' % ('scenario', 'xfers', 'bytes', 'polls', 'bus ms', 'blocked ms', 'prop hit', 'switch ms'))
+    for r in results:
+        print('%-20s %6d %6d %6d %10.1f %11.1f %9d %9s' % (r['name'], r['transactions'], r['bytes'],
+              r['status_reads'], r['bus_us'] / 1000, r['blocked_us'] / 1000, r['prop_hits'],
+              r.get('switch_ms') or '-'))
+
+
+def check(results, baseline, tolerance):
+    base = {r['name']: r for r in baseline}
+    failed = []
+    for r in results:
+        b = base.get(r['name'])
+        if b is None:
+            continue
+        for m in METRICS:
+            if r[m] > b[m] * (1 + tolerance):
+                failed.append('%s: %s %d > %d' % (r['name'], m, r[m], b[m]))
+    return failed
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--freq', type=int, default=50_000, help='I2C bus frequency in Hz')
+    p.add_argument('--irq', action='store_true', help='wait for CTS/STC on the emulated GPO2/INT line')
+    p.add_argument('--async', dest='asynchronous', action='store_true',
+                   help='drive Si4735_async and report the longest UI stall as blocked time')
+    p.add_argument('--json', action='store_true', help='print the results as JSON')
+    p.add_argument('--save', metavar='FILE', help='write the results to FILE')
+    p.add_argument('--check', metavar='FILE', help='compare against results saved with --save')
+    p.add_argument('--tolerance', type=float, default=0.05, help='allowed relative regression for --check')
+    args = p.parse_args(argv)
+
+    results = run_all(args.freq, args.irq, args.asynchronous)
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        print_table(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.check:
+        with open(args.check) as f:
+            failed = check(results, json.load(f), args.tolerance)
+        for line in failed:
+            print('REGRESSION ' + line)
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+'''
+  Host check of the idle detection in Application/lv_utils.py, on the simulated clock of
+  si4735_emu. A stand-in lvgl reports one animation running all the time, like the circular
+  scroll of the RadioText label; the event loop must still drop to idle_freq once there was
+  no input for idle_after_ms, and go back to full rate on input or wake(). memmgr.MemMgr,
+  driven like main.py memFrame() does, must collect in those idle frames and not while
+  there is input.
+
+    python3 check_idle.py          # prints the checks, exit status 1 if one failed
+'''
+import os
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(1, os.path.join(HERE, '..', 'Application'))
+
+import si4735_emu
+import uasyncio
+
+
+class Heap(object):
+    'Stand-in for the MicroPython gc module: every frame allocates *per_frame* bytes of garbage.'
+    def __init__(self, size=160 * 1024, live=60 * 1024, per_frame=100):
+        self.size = size
+        self.live = live
+        self.alloc = live
+        self.per_frame = per_frame
+        self.collects = 0
+        self.low = size - live          # lowest free heap seen by a frame
+
+    def frame(self):
+        self.alloc += self.per_frame
+        self.low = min(self.low, self.mem_free())
+
+    def collect(self):
+        self.alloc = self.live
+        self.collects += 1
+
+    def threshold(self, n):
+        pass
+
+    def mem_alloc(self):
+        return self.alloc
+
+    def mem_free(self):
+        return self.size - self.alloc
+
+
+class Display(object):
+    def __init__(self, clock):
+        self.clock = clock
+        self.last_input = 0
+
+    def touch(self):
+        self.last_input = self.clock.ticks_ms()
+
+    def get_inactive_time(self):
+        return self.clock.ticks_ms() - self.last_input
+
+
+def fake_lvgl(clock):
+    'The part of lvgl that lv_utils uses; anim_count_running() never drops to 0.'
+    lv = types.ModuleType('lvgl')
+    lv._nesting = types.SimpleNamespace(value=0)
+    lv.display = Display(clock)
+    lv.runs = 0
+
+    def task_handler():
+        lv.runs += 1
+        return 33                       # the display refresh timer, LV_DEF_REFR_PERIOD
+
+    lv.is_initialized = lambda: True
+    lv.init = lambda: None
+    lv.tick_inc = lambda ms: None
+    lv.task_handler = task_handler
+    lv.anim_count_running = lambda: 1
+    lv.disp_get_default = lambda: lv.display
+    return lv
+
+
+def load(clock):
+    sys.modules['lvgl'] = fake_lvgl(clock)
+    sys.modules['usys'] = types.SimpleNamespace(platform='host', print_exception=print)
+    sys.modules['lv_timer'] = types.SimpleNamespace(Timer=object)
+    import lv_utils
+    lv_utils.time = clock
+    return lv_utils
+
+
+def rate(loop, clock, ms):
+    'task_handler runs per second over the next *ms* of simulated time.'
+    lv = sys.modules['lvgl']
+    runs = lv.runs
+    uasyncio.run(until_us=clock.now_us + ms * 1000)
+    return (lv.runs - runs) * 1000 // ms
+
+
+class Checks(object):
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, name, ok, detail=''):
+        print('%-44s %s %s' % (name, 'ok  ' if ok else 'FAIL', detail))
+        if not ok:
+            self.failed += 1
+
+
+def check_event_loop(c, clock, lv_utils):
+    lv = sys.modules['lvgl']
+    loop = lv_utils.event_loop(asynchronous=True)
+    lv.display.touch()
+    r = rate(loop, clock, 1000)
+    c.expect('input: full rate', loop.is_active() and r >= 25, '%d/s' % r)
+    uasyncio.run(until_us=clock.now_us + loop.idle_after_ms * 1000)
+    r = rate(loop, clock, 2000)
+    c.expect('animation, no input: idle rate', not loop.is_active() and r <= 4, '%d/s' % r)
+    loop.wake()
+    r = rate(loop, clock, 1000)
+    c.expect('wake(): full rate again', loop.is_active() and r >= 25, '%d/s' % r)
+    return loop
+
+
+def check_memmgr(c, clock, loop):
+    import memmgr
+    heap = memmgr.gc = Heap()
+    mem = memmgr.MemMgr()
+
+    def memFrame():
+        heap.frame()
+        mem.frame(not loop.is_active())
+
+    loop.refresh_cb = memFrame
+    lv = sys.modules['lvgl']
+    n = heap.collects
+    for s in range(10):                 # ten seconds of touching: no idle frame
+        lv.display.touch()
+        uasyncio.run(until_us=clock.now_us + 1000 * 1000)
+    c.expect('input: no idle collection', heap.collects == n, '%d collections' % (heap.collects - n))
+    n = heap.collects
+    heap.low = heap.mem_free()
+    uasyncio.run(until_us=clock.now_us + 60 * 1000 * 1000)
+    c.expect('animation, no input: idle collections', heap.collects > n and heap.low > memmgr.LOW_WATER,
+             '%d in 60 s, free heap >= %d' % (heap.collects - n, heap.low))
+
+
+def main():
+    clock = si4735_emu.SimClock()
+    uasyncio.clock = clock
+    uasyncio.tasks = []
+    lv_utils = load(clock)
+    c = Checks()
+    loop = check_event_loop(c, clock, lv_utils)
+    check_memmgr(c, clock, loop)
+    return 1 if c.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
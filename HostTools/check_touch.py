@@ -0,0 +1,180 @@
+'''
+  Host check of the XPT2046 sampling in Application/MSP2807_XPT2046.py against an emulated
+  touch panel on a fake SPI bus: the Z1 pen-down gate, the settle/median filter and the
+  number of SPI transactions a read costs. Then the fixed point calibration: the coefficients
+  derived from the ranges against the old float mapping in all four rotations, affine()
+  solving a skewed and rotated panel from three points, and the products of _affine
+  staying within the 32 bit ints of viper.
+
+    python3 check_touch.py         # prints the checks, exit status 1 if one failed
+'''
+import os
+import sys
+import random
+import builtins
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(1, os.path.join(HERE, '..', 'Application'))
+
+import micropython
+
+# MicroPython builtins the driver uses; viper code runs as plain Python here
+builtins.const = micropython.const
+builtins.ptr32 = object
+micropython.viper = lambda f: f
+import machine
+machine.SPI = object                # only named in an annotation; Panel stands in for the bus
+import MSP2807_XPT2046 as xpt
+
+RANGES = ((100, 1900), (200, 1950))
+W, H = 240, 320
+
+
+class Panel(object):
+    '''
+    XPT2046 behind machine.SPI.write_readinto: answers the channel of the command byte with
+    the pressure and position of a finger at raw (*x*, *y*), or none if *x* is None. *noise*
+    is added to every position reading; *spike_every* turns every n-th one into an outlier;
+    *lift_after*: Z1 drops after that many transactions, while X and Y still read a position,
+    as a panel does when the finger lifts between the conversions.
+    '''
+    def __init__(self, x=None, y=None, noise=0, spike_every=0, lift_after=None, seed=1):
+        self.x, self.y = x, y
+        self.noise = noise
+        self.spike_every = spike_every
+        self.lift_after = lift_after
+        self.rand = random.Random(seed)
+        self.transactions = 0
+        self.readings = 0
+
+    def down(self):
+        return self.x is not None and (self.lift_after is None or self.transactions <= self.lift_after)
+
+    def position(self, v):
+        self.readings += 1
+        if self.spike_every and self.readings % self.spike_every == 0:
+            return v + 400
+        return v + self.rand.randint(-self.noise, self.noise)
+
+    def write_readinto(self, out, into):
+        self.transactions += 1
+        chan = out[0] & 0x70
+        if chan == xpt.Xpt2046.CHAN_Z1:
+            v = 600 if self.down() else 0
+        elif self.x is None:
+            v = 0
+        elif chan == xpt.Xpt2046.CHAN_X:
+            v = self.position(self.x)
+        elif chan == xpt.Xpt2046.CHAN_Y:
+            v = self.position(self.y)
+        else:
+            v = 0
+        v = max(0, min(4095, v))
+        into[1] = v >> 4
+        into[2] = (v & 0x0F) << 4
+
+
+def touch(panel, rot=xpt.PORTRAIT):
+    return xpt.Xpt2046_hw(spi=panel, cs=machine.Pin(16), ranges=RANGES, width=W, height=H, rot=rot)
+
+
+def linear(rx, ry, rot=xpt.PORTRAIT):
+    'Pixel of the ranges mapping the driver used before the calibration, for comparison.'
+    x = int(W / (RANGES[0][1] - RANGES[0][0]) * (rx - RANGES[0][0]))
+    y = int(H / (RANGES[1][1] - RANGES[1][0]) * (ry - RANGES[1][0]))
+    return ((x, H - y), (H - y, W - x), (W - x, y), (y, x))[rot]
+
+
+class Checks(object):
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, name, ok, detail=''):
+        print('%-44s %s %s' % (name, 'ok  ' if ok else 'FAIL', detail))
+        if not ok:
+            self.failed += 1
+
+
+def off_by(p, q):
+    return max(abs(p[0] - q[0]), abs(p[1] - q[1]))
+
+
+def check_sampling(c):
+    p = Panel()
+    r = touch(p).pos()
+    c.expect('pen up: None in one transaction', r is None and p.transactions == 1,
+             '%d transactions' % p.transactions)
+
+    p = Panel(1000, 1000)
+    r = touch(p).pos()
+    c.expect('steady touch: position', r is not None and off_by(r, linear(1000, 1000)) <= 1,
+             '%s, expected %s' % (r, linear(1000, 1000)))
+    c.expect('steady touch: 8 transactions', p.transactions == 8, '%d transactions' % p.transactions)
+
+    p = Panel(1000, 1000, noise=6, spike_every=3)
+    r = touch(p).pos()
+    c.expect('noise and outliers: median holds', r is not None and off_by(r, linear(1000, 1000)) <= 2,
+             '%s, expected %s, %d transactions' % (r, linear(1000, 1000), p.transactions))
+
+    p = Panel(50, 1000)
+    r = touch(p).pos()
+    c.expect('readings outside the ranges: None', r is None, '%d transactions' % p.transactions)
+
+    p = Panel(1000, 1000, lift_after=5)
+    r = touch(p).pos()
+    c.expect('finger lifted while sampling: None', r is None and p.transactions == 8,
+             '%d transactions' % p.transactions)
+
+
+def viper_fits(cal):
+    'Largest |term| of _affine over the whole 12 bit raw range; viper ints are 32 bit.'
+    worst = 0
+    for rx in (0, 4095):
+        for ry in (0, 4095):
+            for a, b, k in (cal[0:3], cal[3:6]):
+                worst = max(worst, abs(a * rx), abs(b * ry), abs(a * rx + b * ry + k))
+    return worst
+
+
+def check_calibration(c):
+    for rot in range(4):
+        t = touch(Panel(), rot)
+        worst = 0
+        for rx in range(RANGES[0][0], RANGES[0][1] + 1, 25):
+            for ry in range(RANGES[1][0], RANGES[1][1] + 1, 25):
+                p = t._raw2px(rx, ry)
+                q = linear(rx, ry, rot)
+                q = (min(max(q[0], 0), t.size[0] - 1), min(max(q[1], 0), t.size[1] - 1))
+                worst = max(worst, off_by(p, q))
+        c.expect('range_cal rot %d: as the old mapping' % rot, worst <= 1, 'off by %d px' % worst)
+        c.expect('range_cal rot %d: fits viper ints' % rot, viper_fits(t.cal) < 1 << 31,
+                 'largest term %d' % viper_fits(t.cal))
+
+    # a panel mounted a little turned and skewed: raw = M * pixel + offset
+    def raw(x, y):
+        return round(100 + 7.4 * x + 0.3 * y), round(1900 - 0.2 * x - 5.3 * y)
+    targets = ((24, 24), (216, 160), (120, 296))
+    cal = xpt.affine(targets, [raw(x, y) for x, y in targets])
+    t = touch(Panel())
+    t.set_cal(cal)
+    rand = random.Random(2)
+    worst = 0
+    for _ in range(500):
+        x, y = rand.randrange(W), rand.randrange(H)
+        worst = max(worst, off_by(t._raw2px(*raw(x, y)), (x, y)))
+    c.expect('affine: skewed panel from three points', worst <= 1, 'off by %d px' % worst)
+    c.expect('affine: fits viper ints', viper_fits(cal) < 1 << 31, 'largest term %d' % viper_fits(cal))
+    c.expect('affine: points on a line give None',
+             xpt.affine(((0, 0), (10, 10), (20, 20)), ((100, 100), (200, 200), (300, 300))) is None)
+
+
+def main():
+    c = Checks()
+    check_sampling(c)
+    check_calibration(c)
+    return 1 if c.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+'''
+  Compile the station list files Application/[0-9].txt into the binary N.idx files read by
+  Application/stationindex.py. Copy them to the Pico next to the .txt files; without them the
+  radio builds each index the first time its area is opened.
+
+    python3 compile_stations.py              # writes ../Application/N.idx
+    python3 compile_stations.py -o out/      # writes out/N.idx
+'''
+import os
+import sys
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(HERE, '..', 'Application')
+sys.path.insert(0, HERE)
+sys.path.insert(1, APP)
+
+import Si4735
+import stationindex
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('-s', '--src', default=APP, help='directory holding [0-9].txt')
+    p.add_argument('-o', '--out', default=None, help='directory for the N.idx files (default: --src)')
+    args = p.parse_args(argv)
+    out = args.out or args.src
+    os.makedirs(out, exist_ok=True)
+    for area in '0123456789':
+        src = os.path.join(args.src, area + '.txt')
+        if not os.path.exists(src):
+            continue
+        dst = os.path.join(out, area + '.idx')
+        stationindex.build(src, dst, Si4735.bandIndex)
+        idx = stationindex.StationIndex(dst)
+        print('%s: %d rows, %d bytes' % (dst, idx.count, os.path.getsize(dst)))
+        idx.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+'''
+  Minimal CPython stand-in for the MicroPython `micropython` module.
+'''
+
+
+def const(x):
+    return x
@@ -0,0 +1,446 @@
+'''
+  Host-side (CPython) emulation of the Si4735 as seen through machine.I2C.
+
+  The model covers the commands used by Application/Si4735.py: POWER_UP, POWER_DOWN,
+  SET_PROPERTY/GET_PROPERTY, FM/AM_TUNE_FREQ, FM/AM_SEEK_START, FM/AM_TUNE_STATUS,
+  FM/AM_RSQ_STATUS and FM_RDS_STATUS. Every command clears CTS for a datasheet-like amount of time and
+  tune/seek commands raise STCINT when the simulated tuning has finished. When an
+  *int_pin* is given, GPO2/INT is driven low for enabled CTS/STC interrupts.
+
+  Time is virtual: SimClock only moves forward when the bus is used or when the driver
+  sleeps, so a benchmark of a 3 second band switch finishes instantly. Install the clock
+  into the driver module with `Si4735.time = clock` before creating the driver.
+'''
+import errno
+
+# status byte bits
+STATUS_CTS    = 0x80
+STATUS_ERR    = 0x40
+STATUS_RSQINT = 0x08
+STATUS_RDSINT = 0x04
+STATUS_STCINT = 0x01
+
+# command execution time in us until CTS is set again
+CTS_TIME_US = {
+    0x01: 110_000,  # POWER_UP
+    0x10: 300,      # GET_REV
+    0x11: 10,       # POWER_DOWN
+    0x12: 10_000,   # SET_PROPERTY
+    0x13: 300,      # GET_PROPERTY
+    0x14: 300,      # GET_INT_STATUS
+    0x20: 300,      # FM_TUNE_FREQ
+    0x21: 300,      # FM_SEEK_START
+    0x22: 300,      # FM_TUNE_STATUS
+    0x23: 300,      # FM_RSQ_STATUS
+    0x40: 300,      # AM_TUNE_FREQ
+    0x41: 300,      # AM_SEEK_START
+    0x42: 300,      # AM_TUNE_STATUS
+    0x43: 300,      # AM_RSQ_STATUS
+}
+
+# time in us until STCINT after a tune, or per channel visited during a seek
+STC_TIME_US = {'FM': 60_000, 'AM': 80_000}
+STC_FAST_TIME_US = {'FM': 20_000, 'AM': 20_000}
+
+# default properties after POWER_UP (AN332)
+DEFAULT_PROPERTIES = {
+    'FM': {0x1100: 0x0002, 0x1400: 8750, 0x1401: 10790, 0x1402: 10,
+           0x1403: 3, 0x1404: 20, 0x4000: 63, 0x4001: 0},
+    'AM': {0x3400: 520, 0x3401: 1710, 0x3402: 10,
+           0x3403: 5, 0x3404: 25, 0x4000: 63, 0x4001: 0},
+}
+
+# synthetic band: (frequency, rssi dBuV at the carrier, snr dB at the carrier)
+# FM frequencies are in 10kHz units, AM frequencies in kHz as on the chip
+FM_STATIONS = [
+    (7970, 48, 22), (8000, 40, 18), (8130, 55, 25), (8250, 36, 15),
+    (8470, 60, 28), (8520, 30, 12), (8810, 52, 24), (8990, 44, 20),
+    (9050, 58, 26), (9300, 38, 16),
+]
+AM_STATIONS = [
+    (594, 62, 30), (666, 57, 26), (693, 50, 22), (729, 45, 18), (828, 66, 32),
+    (954, 54, 24), (1008, 47, 20), (1134, 58, 27), (1242, 52, 23), (1314, 40, 15),
+    (6055, 34, 12), (9750, 38, 14), (11780, 30, 10),
+]
+
+NOISE_FLOOR = 4
+
+# RDS of some FM stations: PI, PS, RadioText, PTY. Groups 0A and 2A are sent in turn,
+# one every RDS_GROUP_US; every RDS_ERROR_EVERY-th group has an uncorrectable block B.
+FM_RDS = {
+    8130: (0x1A01, 'EMU-FM', 'Emulated RadioText on 81.3MHz', 10),
+    8470: (0x1A02, 'HOST 84', 'Now on air: the Si4735 host emulator', 12),
+}
+RDS_GROUP_US = 87_600
+RDS_FIFO_MAX = 25
+RDS_ERROR_EVERY = 11
+
+
+class SimClock(object):
+    '''Virtual microsecond clock with the MicroPython `time` API used by the drivers.'''
+    def __init__(self):
+        self.now_us = 0
+        self.slept_us = 0
+        self.listeners = []
+
+    def advance(self, us):
+        self.now_us += int(us)
+        for cb in self.listeners:
+            cb()
+
+    def sleep(self, s):
+        self.sleep_us(s * 1_000_000)
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms * 1000)
+
+    def sleep_us(self, us):
+        self.slept_us += int(us)
+        self.advance(us)
+
+    def ticks_us(self):
+        return self.now_us
+
+    def ticks_ms(self):
+        return self.now_us // 1000
+
+    def ticks_add(self, ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    def time(self):
+        return self.now_us // 1_000_000
+
+
+class Si4735Chip(object):
+    '''Command-level model of the Si4735 with a synthetic band of stations.'''
+    def __init__(self, clock, fm_stations=FM_STATIONS, am_stations=AM_STATIONS, int_pin=None):
+        self.clock = clock
+        self.stations = {'FM': fm_stations, 'AM': am_stations}
+        self.int_pin = int_pin
+        self.int_level = 1
+        self.reset()
+        clock.listeners.append(self.update_int)
+
+    def reset(self):
+        self.func = None                # None while powered down, 'FM' or 'AM'
+        self.int_cts = False            # POWER_UP CTSIEN
+        self.gpo2_int = False           # POWER_UP GPO2OEN
+        self.cts_pending = False        # CTS interrupt not cleared by a new command yet
+        self.properties = {}
+        self.freq = 0
+        self.cts_at = 0
+        self.stc_at = None              # time STCINT is raised, None if no tune pending
+        self.stcint = False
+        self.err = False
+        self.bltf = False
+        self.seek = None                # (start_us, per_us, channels) while seeking
+        self.resp = bytes([STATUS_CTS])
+        self.history = []
+        self.rds_fifo = []
+        self.rds_at = 0                 # time the next RDS group is complete
+        self.rds_seq = 0
+
+    # -- signal model -------------------------------------------------------
+
+    def signal(self, freq):
+        if self.func is None:
+            return 0, 0
+        best_rssi, best_snr = NOISE_FLOOR + (freq * 7) % 3, 0
+        spacing = 10 if self.func == 'FM' else 9
+        for f, rssi, snr in self.stations[self.func]:
+            off = abs(freq - f)
+            if off * 2 > spacing * 3:
+                continue
+            loss = off * 30 // spacing
+            if rssi - loss > best_rssi:
+                best_rssi, best_snr = rssi - loss, max(0, snr - loss)
+        return best_rssi, best_snr
+
+    def is_valid(self, freq):
+        rssi, snr = self.signal(freq)
+        if self.func == 'FM':
+            return rssi >= self.properties.get(0x1404, 20) and snr >= self.properties.get(0x1403, 3)
+        return rssi >= self.properties.get(0x3404, 25) and snr >= self.properties.get(0x3403, 5)
+
+    def band(self):
+        base = 0x1400 if self.func == 'FM' else 0x3400
+        p = self.properties
+        return p.get(base), p.get(base + 1), p.get(base + 2)
+
+    # -- timing -------------------------------------------------------------
+
+    def now(self):
+        return self.clock.now_us
+
+    def cts(self):
+        return self.now() >= self.cts_at
+
+    def update(self):
+        if self.stc_at is not None and self.now() >= self.stc_at:
+            if self.seek is not None:
+                self.freq = self.seek[2][-1]
+                self.seek = None
+            self.stc_at = None
+            self.stcint = True
+        elif self.seek is not None:
+            start_us, per_us, channels = self.seek[0], self.seek[1], self.seek[2]
+            idx = min(len(channels) - 1, (self.now() - start_us) // per_us)
+            self.freq = channels[idx]
+
+    def status(self):
+        self.update()
+        st = 0
+        if self.cts():
+            st |= STATUS_CTS
+        if self.err:
+            st |= STATUS_ERR
+        if self.stcint:
+            st |= STATUS_STCINT
+        return st
+
+    def update_int(self):
+        '''Drive GPO2/INT low while an enabled interrupt is pending, like the chip does.'''
+        if self.int_pin is None:
+            return
+        self.update()
+        ien = self.properties.get(0x0001, 0)
+        asserted = self.gpo2_int and (
+            (self.cts_pending and self.cts() and (self.int_cts or ien & 0x80)) or
+            (self.stcint and ien & 0x01))
+        level = 0 if asserted else 1
+        if level != self.int_level:
+            self.int_level = level
+            self.int_pin.value(level)
+            if level == 0 and self.int_pin.handler:
+                self.int_pin.handler(self.int_pin)
+
+    # -- bus interface ------------------------------------------------------
+
+    def write(self, buf):
+        self.update()
+        cmd = buf[0]
+        self.history.append(cmd)
+        if not self.cts():
+            # the real chip ignores commands sent while it is busy
+            self.err = True
+            return
+        self.err = False
+        self.cts_at = self.now() + CTS_TIME_US.get(cmd, 300)
+        self.cts_pending = True
+        handler = getattr(self, 'cmd_%02X' % cmd, None)
+        if handler is None or (self.func is None and cmd != 0x01):
+            # powered down, the chip takes POWER_UP only; POWER_DOWN too answers ERR
+            self.err = True
+            self.resp = b''
+            return
+        self.resp = handler(bytes(buf[1:])) or b''
+        self.update_int()
+
+    def read(self, n):
+        st = self.status()
+        if n <= 1 or not (st & STATUS_CTS):
+            return bytes([st]) + bytes(max(0, n - 1))
+        data = bytes([st]) + self.resp
+        return (data + bytes(n))[:n]
+
+    # -- commands -----------------------------------------------------------
+
+    def cmd_01(self, args):                             # POWER_UP
+        func = args[0] & 0x0F
+        if func not in (0, 1):
+            self.err = True
+            return
+        self.func = 'FM' if func == 0 else 'AM'
+        self.int_cts = bool(args[0] & 0x80)
+        self.gpo2_int = bool(args[0] & 0x40)
+        self.properties = dict(DEFAULT_PROPERTIES[self.func])
+        self.freq = self.properties[0x1400 if self.func == 'FM' else 0x3400]
+        self.stcint = False
+
+    def cmd_10(self, args):                             # GET_REV
+        return bytes([35, 0x32, 0x30, 0, 0, 0x32, 0x30, 0x41])
+
+    def cmd_11(self, args):                             # POWER_DOWN
+        self.func = None
+        self.int_cts = False
+        self.gpo2_int = False
+        self.seek = None
+        self.stc_at = None
+        self.stcint = False
+
+    def cmd_12(self, args):                             # SET_PROPERTY
+        prop = (args[1] << 8) | args[2]
+        self.properties[prop] = (args[3] << 8) | args[4]
+
+    def cmd_13(self, args):                             # GET_PROPERTY
+        prop = (args[1] << 8) | args[2]
+        val = self.properties.get(prop, 0)
+        return bytes([0, val >> 8, val & 0xFF])
+
+    def cmd_14(self, args):                             # GET_INT_STATUS
+        return b''
+
+    def _tune(self, args, func):
+        if self.func != func:
+            self.err = True
+            return
+        self.freq = (args[1] << 8) | args[2]
+        self.seek = None
+        self.stcint = False
+        self.rds_fifo = []
+        self.rds_seq = 0
+        self.bltf = False
+        fast = args[0] & 0x01
+        self.stc_at = self.now() + (STC_FAST_TIME_US if fast else STC_TIME_US)[func]
+
+    def _seek(self, args, func):
+        if self.func != func:
+            self.err = True
+            return
+        bottom, top, spacing = self.band()
+        self.rds_fifo = []
+        self.rds_seq = 0
+        up, wrap = args[0] & 0x08, args[0] & 0x04
+        step = spacing if up else -spacing
+        channels = []
+        f = self.freq
+        self.bltf = False
+        while True:
+            f += step
+            if f > top or f < bottom:
+                if not wrap:
+                    self.bltf = True
+                    f = top if up else bottom
+                    channels.append(f)
+                    break
+                f = bottom if up else top
+            if f == self.freq or len(channels) > (top - bottom) // spacing:
+                channels.append(f)
+                self.bltf = True
+                break
+            channels.append(f)
+            if self.is_valid(f):
+                break
+        self.stcint = False
+        per_us = STC_TIME_US[func]
+        self.seek = (self.now(), per_us, channels)
+        self.stc_at = self.now() + per_us * len(channels)
+
+    def _tune_status(self, args):
+        self.update()
+        if args[0] & 0x01:
+            self.stcint = False
+        rssi, snr = self.signal(self.freq)
+        valid = 0x01 if self.seek is None and self.is_valid(self.freq) else 0x00
+        resp1 = (0x80 if self.bltf else 0x00) | valid
+        return bytes([resp1, self.freq >> 8, self.freq & 0xFF, rssi, snr, 0, 0])
+
+    def _rsq_status(self, args):
+        rssi, snr = self.signal(self.freq)
+        valid = 0x01 if self.is_valid(self.freq) else 0x00
+        stblend = 0
+        if self.func == 'FM':
+            stblend = max(0, min(100, (rssi - 20) * 3))
+        pilot = 0x80 if stblend > 0 else 0x00
+        return bytes([0, valid, pilot | stblend, rssi, snr, 0, 0])
+
+    def rds_groups(self):
+        'Blocks A-D of the groups the station at self.freq sends in turn.'
+        pi, ps, rt, pty = FM_RDS[self.freq]
+        groups = []
+        for seg in range(4):
+            d = ps.ljust(8)[seg * 2:seg * 2 + 2].encode()
+            groups.append((pi, (pty << 5) | seg, 0xE0CD, d[0] << 8 | d[1]))
+        text = (rt + '\r').encode()
+        for seg in range((len(text) + 3) // 4):
+            c = (text[seg * 4:seg * 4 + 4] + b'    ')[:4]
+            groups.append((pi, 0x2000 | (pty << 5) | seg, c[0] << 8 | c[1], c[2] << 8 | c[3]))
+        return groups
+
+    def rds_update(self):
+        'Queue the groups received since the last call, if RDS is on and a station sends it.'
+        now = self.now()
+        if (self.func != 'FM' or self.seek is not None or self.freq not in FM_RDS or
+                not self.properties.get(0x1502, 0) & 0x01):
+            self.rds_at = now + RDS_GROUP_US
+            return
+        groups = self.rds_groups()
+        while self.rds_at <= now:
+            a, b, c, d = groups[self.rds_seq % len(groups)]
+            ble = 0
+            if self.rds_seq % RDS_ERROR_EVERY == RDS_ERROR_EVERY - 1:
+                b, ble = b ^ 0x5A5A, 0x30
+            self.rds_fifo.append((a, b, c, d, ble))
+            del self.rds_fifo[:-RDS_FIFO_MAX]
+            self.rds_seq += 1
+            self.rds_at += RDS_GROUP_US
+
+    def _rds_status(self, args):
+        self.rds_update()
+        group = (0, 0, 0, 0, 0)
+        if not args[0] & 0x04 and self.rds_fifo:           # not STATUSONLY: pop a group
+            group = self.rds_fifo.pop(0)
+        a, b, c, d, ble = group
+        recv = 0x01 if self.rds_fifo else 0x00
+        return bytes([recv, 0x01 if self.freq in FM_RDS else 0x00, len(self.rds_fifo),
+                      a >> 8, a & 0xFF, b >> 8, b & 0xFF, c >> 8, c & 0xFF, d >> 8, d & 0xFF, ble])
+
+    def cmd_20(self, args): return self._tune(args, 'FM')           # FM_TUNE_FREQ
+    def cmd_21(self, args): return self._seek(args, 'FM')           # FM_SEEK_START
+    def cmd_22(self, args): return self._tune_status(args)          # FM_TUNE_STATUS
+    def cmd_23(self, args): return self._rsq_status(args)           # FM_RSQ_STATUS
+    def cmd_24(self, args): return self._rds_status(args)           # FM_RDS_STATUS
+    def cmd_40(self, args): return self._tune(args, 'AM')           # AM_TUNE_FREQ
+    def cmd_41(self, args): return self._seek(args, 'AM')           # AM_SEEK_START
+    def cmd_42(self, args): return self._tune_status(args)          # AM_TUNE_STATUS
+    def cmd_43(self, args): return self._rsq_status(args)           # AM_RSQ_STATUS
+
+
+class I2C(object):
+    '''
+    Stand-in for machine.I2C with a Si4735Chip at *addr*.
+    Each transfer advances the clock by its wire time and is counted in *stats*.
+    '''
+    def __init__(self, id=0, *, scl=None, sda=None, freq=400_000, chip=None, clock=None, addr=0x63):
+        self.freq = freq
+        self.clock = clock if clock is not None else SimClock()
+        self.chip = chip if chip is not None else Si4735Chip(self.clock)
+        self.addr = addr
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'transactions': 0, 'writes': 0, 'reads': 0, 'status_reads': 0,
+                      'bytes': 0, 'bus_us': 0}
+
+    def _transfer(self, addr, nbytes):
+        # START + address byte + data bytes, 9 clocks per byte, STOP
+        us = ((1 + nbytes) * 9 + 2) * 1_000_000 // self.freq
+        self.clock.advance(us)
+        self.stats['transactions'] += 1
+        self.stats['bytes'] += nbytes
+        self.stats['bus_us'] += us
+        if addr != self.addr or self.chip is None:
+            raise OSError(errno.ENODEV, 'ENODEV')
+
+    def writeto(self, addr, buf, stop=True):
+        self.stats['writes'] += 1
+        self._transfer(addr, len(buf))
+        self.chip.write(buf)
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self.stats['reads'] += 1
+        if nbytes == 1:
+            self.stats['status_reads'] += 1
+        self._transfer(addr, nbytes)
+        return self.chip.read(nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        data = self.readfrom(addr, len(buf))
+        buf[:] = data
+
+    def scan(self):
+        return [self.addr] if self.chip is not None else []
@@ -0,0 +1,114 @@
+'''
+  Minimal CPython stand-in for MicroPython uasyncio, running tasks in the simulated time of
+  si4735_emu.SimClock so that bench_si4735.py can drive Application/Si4735_async.py.
+
+  Only what the driver uses is provided: create_task, sleep_ms, sleep and Event. The loop is
+  stepped explicitly with run(); max_slice_us records the longest time one task kept the
+  loop busy, i.e. how long the LVGL task would have been held off.
+'''
+clock = None
+tasks = []
+max_slice_us = 0
+
+
+class _Sleep(object):
+    def __init__(self, us):
+        self.us = us
+
+    def __await__(self):
+        yield ('time', clock.now_us + self.us)
+
+
+def sleep_ms(ms):
+    return _Sleep(int(ms) * 1000)
+
+
+def sleep(s):
+    return _Sleep(int(s * 1_000_000))
+
+
+class Event(object):
+    def __init__(self):
+        self.state = False
+
+    def set(self):
+        self.state = True
+
+    def clear(self):
+        self.state = False
+
+    def is_set(self):
+        return self.state
+
+    async def wait(self):
+        while not self.state:
+            await _Wait(self)
+        return True
+
+
+class _Wait(object):
+    def __init__(self, event):
+        self.event = event
+
+    def __await__(self):
+        yield ('event', self.event)
+
+
+class Task(object):
+    def __init__(self, coro):
+        self.coro = coro
+        self.cond = None
+        self.done = False
+
+    def ready(self):
+        if self.cond is None:
+            return True
+        kind, arg = self.cond
+        if kind == 'time':
+            return arg <= clock.now_us
+        return arg.state
+
+    def cancel(self):
+        self.done = True
+        if self in tasks:
+            tasks.remove(self)
+
+
+def create_task(coro):
+    t = Task(coro)
+    tasks.append(t)
+    return t
+
+
+def reset():
+    global max_slice_us
+    max_slice_us = 0
+
+
+def run(until_us=None, idle=None):
+    '''
+    Run ready tasks, advancing the clock to the next deadline whenever all of them wait.
+    Stops at *until_us* or, if given, as soon as *idle()* is true while no task is ready.
+    '''
+    global max_slice_us
+    while True:
+        ready = [t for t in tasks if t.ready()]
+        if not ready:
+            if idle is not None and idle():
+                return
+            deadlines = [t.cond[1] for t in tasks if t.cond[0] == 'time']
+            if not deadlines and until_us is None:
+                return
+            nxt = min(deadlines) if deadlines else until_us
+            if until_us is not None and nxt >= until_us:
+                clock.advance(until_us - clock.now_us)
+                return
+            clock.advance(nxt - clock.now_us)
+            continue
+        for t in ready:
+            start = clock.now_us
+            try:
+                t.cond = t.coro.send(None)
+            except StopIteration:
+                t.cancel()
+            max_slice_us = max(max_slice_us, clock.now_us - start)